@@ -1,51 +1,333 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, session, send_from_directory
+from flask import Flask, render_template, redirect, url_for, flash, request, session, send_from_directory, send_file, jsonify, Response, abort, g, has_request_context, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import ClientDisconnected
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from datetime import datetime
+from sqlalchemy import Select, insert, select, update, delete, literal, tuple_, and_, or_, func, exists, event, DDL, table, column
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError, OperationalError
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
+import click
+import csv
+import functools
+import hashlib
+import io
+import json
+import mimetypes
+import multiprocessing
 import os
+import queue
+import random
+import sqlite3
+from collections import OrderedDict
+from urllib.parse import quote
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+
+try:
+    import openpyxl
+except ImportError:  # Chỉ cần khi nhập người dùng từ tệp .xlsx
+    openpyxl = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow là phụ thuộc tùy chọn: không có thì không tạo ảnh xem trước
+    Image = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = '11111'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+app.config['DATABASE_MODE'] = 'wal'  # 'wal': WAL, pragma tối ưu, tách engine đọc/ghi; 'default': SQLite mặc định
+app.config['SQLITE_PRAGMAS'] = {  # Áp dụng cho mọi kết nối ở chế độ 'wal'
+    'journal_mode': 'WAL',  # Người đọc không bị chặn khi đang ghi
+    'synchronous': 'NORMAL',  # An toàn với WAL, chỉ fsync khi checkpoint
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # Số âm: KiB, tức 64 MB cho mỗi kết nối
+    'busy_timeout': 5000,  # ms chờ khóa ghi trước khi báo "database is locked"
+}
+app.config['READ_POOL_SIZE'] = 8  # Số kết nối của engine chỉ đọc
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['ATTACHMENT_FOLDER'] = os.path.join('uploads', 'blobs')  # Tệp đính kèm lưu theo mã SHA-256
+app.config['ATTACHMENT_READ_SIZE'] = 64 * 1024  # Kích thước mỗi đoạn khi đọc và băm tệp
+app.config['ATTACHMENT_CACHE_MAX_AGE'] = 365 * 24 * 3600  # Nội dung theo mã băm không bao giờ đổi
+app.config['ATTACHMENT_SENDFILE'] = None  # None, 'x-accel-redirect' (nginx) hoặc 'x-sendfile' (Apache/lighttpd)
+app.config['ATTACHMENT_ACCEL_PREFIX'] = '/_attachments/'  # Location internal của nginx trỏ tới ATTACHMENT_FOLDER
+app.config['DERIVATIVE_FOLDER'] = os.path.join('uploads', 'derivatives')  # Ảnh thu nhỏ/xem trước đã tạo
+app.config['DERIVATIVE_SIZES'] = {'thumb': 256, 'preview': 1280}  # Cạnh dài tối đa (px) của từng loại
+app.config['DERIVATIVE_CACHE_MAX_BYTES'] = 512 * 1024 * 1024  # Vượt quá thì xóa ảnh ít dùng nhất
+app.config['DERIVATIVE_WORKERS'] = 2  # Số tiến trình tạo ảnh
+app.config['DERIVATIVE_WAIT_SECONDS'] = 10  # Thời gian tối đa request chờ ảnh đang được tạo
+app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # Giới hạn mỗi request (form gửi kèm tệp hoặc một đoạn tải lên)
+app.config['UPLOAD_PARTIAL_FOLDER'] = os.path.join('uploads', 'partial')  # Tệp đang tải lên theo từng đoạn
+app.config['UPLOAD_CHUNK_SIZE'] = 8 * 1024 * 1024  # Kích thước đoạn gợi ý cho trình duyệt
+app.config['UPLOAD_MAX_BYTES'] = 1024 * 1024 * 1024  # Kích thước tối đa của một tệp tải lên theo đoạn
+app.config['UPLOAD_SESSION_TTL'] = 24 * 3600  # Phiên tải lên bỏ dở quá lâu sẽ bị xóa
 app.config['ALLOWED_EXTENSIONS'] = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif'}  # Tùy chỉnh theo loại tệp bạn muốn hỗ trợ
-
-db = SQLAlchemy(app)
+app.config['FANOUT_CHUNK_SIZE'] = 500  # Số id tối đa trong một mệnh đề IN khi gửi hàng loạt
+app.config['DISPATCH_CHUNK_SIZE'] = 5000  # Số người nhận được ghi trong mỗi transaction khi gửi nền
+app.config['DISPATCH_WORKERS'] = 2  # Số luồng gửi nền; 0 = xử lý ngay trong request
+app.config['DISPATCH_LEASE_SECONDS'] = 300  # Công việc không cập nhật quá lâu được coi là bị bỏ dở
+app.config['DISPATCH_MAX_ATTEMPTS'] = 5
+app.config['DISPATCH_RETRY_SECONDS'] = 5  # Lần thử lại đầu tiên sau lỗi; nhân đôi sau mỗi lần
+app.config['DISPATCH_RETRY_MAX_SECONDS'] = 600  # Khoảng chờ tối đa giữa hai lần thử lại
+app.config['DISPATCH_LOCKED_RETRIES'] = 8  # Số lần thử lại khi gặp "database is locked"
+app.config['INBOX_PAGE_SIZE'] = 20  # Số thông báo trên mỗi trang hộp thư
+app.config['SENT_PAGE_SIZE'] = 20  # Số thông báo trên mỗi trang lịch sử đã gửi
+app.config['RECIPIENTS_PAGE_SIZE'] = 100  # Số người nhận mỗi lần tải chi tiết
+app.config['SEARCH_BACKEND'] = 'fts'  # 'fts' (SQLite FTS5) hoặc 'like'
+app.config['SEARCH_PAGE_SIZE'] = 20
+app.config['USER_CACHE_SIZE'] = 10000  # Số người dùng tối đa giữ trong cache danh tính
+app.config['USER_CACHE_TTL'] = 60  # Giây; giới hạn thời gian dữ liệu cũ ở các worker khác
+app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'  # Định dạng của werkzeug; đổi giá trị thì mật khẩu được băm lại khi đăng nhập
+app.config['PASSWORD_SALT_LENGTH'] = 16
+app.config['PASSWORD_HASH_WORKERS'] = 2  # Số luồng băm/kiểm tra mật khẩu (scrypt/pbkdf2 nhả GIL khi tính)
+app.config['PASSWORD_HASH_MAX_PENDING'] = 64  # Số yêu cầu băm tối đa đang chờ; vượt quá thì trả 503
+app.config['PASSWORD_HASH_TIMEOUT'] = 10  # Giây chờ tối đa để được vào hàng đợi băm
+app.config['IMPORT_BATCH_SIZE'] = 1000  # Số dòng trong mỗi transaction khi nhập người dùng
+app.config['IMPORT_WORKERS'] = None  # Số tiến trình băm mật khẩu khi nhập; None = số CPU
+app.config['EXPORT_BATCH_SIZE'] = 2000  # Số dòng đọc mỗi lần từ cơ sở dữ liệu khi xuất (yield_per)
+app.config['EXPORT_CHUNK_SIZE'] = 64 * 1024  # Kích thước khối ghi ra response/tệp khi xuất
+app.config['RETENTION_DAYS'] = 365  # flask archive chuyển thông báo cũ hơn số ngày này sang cơ sở dữ liệu lưu trữ
+app.config['ARCHIVE_DATABASE'] = None  # Tệp lưu trữ; None = cạnh tệp chính (site.db -> site-archive.db)
+app.config['ARCHIVE_BATCH_SIZE'] = 500  # Số thông báo chuyển trong mỗi transaction
+app.config['ATTACHMENT_GC_GRACE'] = 24 * 3600  # Giây chờ trước khi xóa tệp đính kèm không còn thông báo nào dùng
+app.config['METRICS_ENABLED'] = False  # Bật /metrics và đo thời gian theo endpoint (FLASK_METRICS_ENABLED=true)
+app.config['METRICS_TOKEN'] = None  # Nếu đặt: Prometheus gửi "Authorization: Bearer <token>"; nếu không chỉ admin xem được
+app.config['METRICS_LATENCY_BUCKETS'] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Giây
+app.config['METRICS_QUERY_BUCKETS'] = (1, 2, 5, 10, 20, 50, 100, 500)  # Số câu lệnh SQL mỗi request
+app.config['SLOW_QUERY_SECONDS'] = 0.25  # Câu lệnh chậm hơn được ghi log kèm nội dung; None = tắt
+app.config['SSE_QUEUE_SIZE'] = 100  # Số sự kiện tối đa chờ gửi cho mỗi kết nối
+app.config['SSE_HEARTBEAT_SECONDS'] = 15  # Gửi heartbeat để phát hiện kết nối đã đóng
+app.config['EVENT_BUS_POLL_SECONDS'] = 0.2  # Chu kỳ mỗi worker đọc nhật ký sự kiện dùng chung
+app.config['EVENT_BUS_RETENTION_SECONDS'] = 3600  # Sự kiện cũ hơn sẽ bị xóa khỏi nhật ký
+app.config.from_prefixed_env()  # Cho phép ghi đè cấu hình bằng biến môi trường FLASK_*
+app.config['USE_X_SENDFILE'] = app.config['ATTACHMENT_SENDFILE'] == 'x-sendfile'  # send_file chỉ trả header X-Sendfile
+
+def split_read_write(config):
+    # Chỉ tách được khi cơ sở dữ liệu là tệp SQLite: hai engine phải cùng nhìn thấy một tệp
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    return (config['DATABASE_MODE'] == 'wal' and uri.startswith('sqlite:')
+            and uri not in ('sqlite://', 'sqlite:///:memory:') and 'mode=memory' not in uri)
+
+if split_read_write(app.config):
+    # Engine ghi chỉ có một kết nối: các lần ghi trong một tiến trình được xếp hàng thay vì tranh khóa
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 1, 'max_overflow': 0, 'pool_timeout': 30,
+                                               **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+    app.config['SQLALCHEMY_BINDS'] = {'read': {'url': app.config['SQLALCHEMY_DATABASE_URI'],
+                                               'pool_size': app.config['READ_POOL_SIZE'], 'max_overflow': 0},
+                                      **app.config.get('SQLALCHEMY_BINDS', {})}
+
+class RoutingSession(FlaskSession):
+    """Session gửi SELECT tới engine đọc và mọi thao tác ghi tới engine ghi.
+
+    Sau lần ghi đầu tiên trong một transaction, mọi câu lệnh tiếp theo (kể cả SELECT)
+    đều dùng engine ghi để đọc được dữ liệu chưa commit của chính transaction đó.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engines = self._db.engines
+        if (bind is None and 'read' in engines and isinstance(clause, Select)
+                and not self._flushing and not self.info.get('wrote')):
+            return engines['read']
+        self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def reset_session_routing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('wrote', None)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+def configure_sqlite_engine(engine, read_only):
+    def on_connect(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        # Tự quản lý BEGIN (xem on_begin) thay vì để pysqlite tự mở transaction DEFERRED
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in app.config['SQLITE_PRAGMAS'].items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if read_only:
+            cursor.execute('PRAGMA query_only = ON')
+        cursor.close()
+
+    def on_begin(connection):
+        # Engine ghi lấy khóa ghi ngay từ đầu transaction: tránh lỗi khi nâng khóa đọc lên khóa ghi
+        connection.exec_driver_sql('BEGIN' if read_only else 'BEGIN IMMEDIATE')
+
+    event.listen(engine, 'connect', on_connect)
+    event.listen(engine, 'begin', on_begin)
+
+# Cơ sở dữ liệu lưu trữ (xem archive_notifications) có cùng cấu trúc rút gọn và chỉ mục FTS5 riêng
+ARCHIVE_DDL = [
+    """CREATE TABLE IF NOT EXISTS archive.notification (
+        id INTEGER PRIMARY KEY, content VARCHAR(500) NOT NULL, type VARCHAR(50) NOT NULL, category VARCHAR(50),
+        user_id INTEGER, file_name VARCHAR(100), attachment_id INTEGER, date_created DATETIME, date_archived DATETIME)""",
+    "CREATE INDEX IF NOT EXISTS archive.ix_notification_date_created_id ON notification (date_created, id)",
+    "CREATE INDEX IF NOT EXISTS archive.ix_notification_user_id ON notification (user_id, date_created, id)",
+    """CREATE TABLE IF NOT EXISTS archive.notification_history (
+        id INTEGER PRIMARY KEY, notification_id INTEGER NOT NULL, sender_id INTEGER NOT NULL,
+        recipient_id INTEGER, group_id INTEGER, date_sent DATETIME, is_seen BOOLEAN)""",
+    "CREATE INDEX IF NOT EXISTS archive.ix_notification_history_notification_id ON notification_history (notification_id)",
+    """CREATE TABLE IF NOT EXISTS archive.user_notification (
+        user_id INTEGER NOT NULL, notification_id INTEGER NOT NULL, is_seen BOOLEAN NOT NULL,
+        PRIMARY KEY (user_id, notification_id))""",
+    "CREATE INDEX IF NOT EXISTS archive.ix_user_notification_notification_id ON user_notification (notification_id, user_id, is_seen)",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS archive.notification_fts USING fts5(
+        content, type, category, content='', tokenize='unicode61 remove_diacritics 2')""",
+]
+
+def archive_database_path(engine):
+    # Chỉ có khi cơ sở dữ liệu chính là tệp SQLite
+    if app.config['ARCHIVE_DATABASE']:
+        return os.path.join(app.instance_path, app.config['ARCHIVE_DATABASE'])
+    database = engine.url.database
+    if engine.dialect.name != 'sqlite' or not database or database == ':memory:' or 'mode=memory' in str(engine.url):
+        return None
+    stem, extension = os.path.splitext(database)
+    return f'{stem}-archive{extension or ".db"}'
+
+def configure_archive(engine, path):
+    def on_connect(dbapi_connection, connection_record):
+        # Gắn tệp lưu trữ vào mọi kết nối với tên "archive" để chép dữ liệu bằng INSERT ... SELECT
+        cursor = dbapi_connection.cursor()
+        cursor.execute('ATTACH DATABASE ? AS archive', (path,))
+        for statement in ARCHIVE_DDL:
+            cursor.execute(statement)
+        if 'attachment_id' not in {row[1] for row in cursor.execute('PRAGMA archive.table_info(notification)')}:
+            # Tệp lưu trữ tạo trước khi bản lưu trữ giữ tham chiếu tới tệp đính kèm
+            try:
+                cursor.execute('ALTER TABLE archive.notification ADD COLUMN attachment_id INTEGER')
+            except sqlite3.OperationalError:
+                pass  # Một kết nối khác vừa thêm cột
+        cursor.close()
+
+    event.listen(engine, 'connect', on_connect)
+
+with app.app_context():
+    archive_path = archive_database_path(db.engine)
+    for bind_key, engine in db.engines.items():
+        if engine.dialect.name != 'sqlite':
+            continue
+        if archive_path:
+            configure_archive(engine, archive_path)  # Đăng ký trước để chạy trước PRAGMA query_only
+        if app.config['DATABASE_MODE'] == 'wal':
+            configure_sqlite_engine(engine, read_only=bind_key == 'read')
 migrate = Migrate(app, db)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+class PasswordHasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+    """Băm và kiểm tra mật khẩu theo PASSWORD_HASH_METHOD trong một thread pool có giới hạn.
+
+    Khi nhiều người đăng nhập cùng lúc, phần tính toán nặng chỉ chiếm tối đa
+    PASSWORD_HASH_WORKERS luồng; hàng đợi quá PASSWORD_HASH_MAX_PENDING thì báo bận
+    thay vì để các request khác chờ theo.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._prefixes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def method(self):
+        return app.config['PASSWORD_HASH_METHOD']
+
+    def generator(self):
+        # Hàm băm dùng được trong process pool (xem import_users)
+        return functools.partial(generate_password_hash, method=self.method,
+                                 salt_length=app.config['PASSWORD_SALT_LENGTH'])
+
+    def hash(self, password):
+        return self.generator()(password)
+
+    def needs_rehash(self, password_hash):
+        # werkzeug lưu "<phương thức đầy đủ>$salt$hash"; 'scrypt' viết tắt được chuẩn hóa một lần
+        prefix = self._prefixes.get(self.method)
+        if prefix is None:
+            prefix = self._prefixes[self.method] = self.hash('').split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != prefix
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                                    thread_name_prefix='password-hash')
+                self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_MAX_PENDING'])
+        if not self._slots.acquire(timeout=app.config['PASSWORD_HASH_TIMEOUT']):
+            raise PasswordHasherBusy()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def verify(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._submit(check_password_hash, password_hash, password)
+
+    def hash_async(self, password):
+        """Như hash() nhưng chạy trong pool, dùng trong request."""
+        return self._submit(self.generator(), password)
+
+password_hasher = PasswordHasher()
+
+@app.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    return 'Server is busy, please try again in a moment', 503
+
 # Define the user_group association table
 user_group = db.Table('user_group',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('group_id', db.Integer, db.ForeignKey('group.id'), primary_key=True)
+    db.Column('group_id', db.Integer, db.ForeignKey('group.id'), primary_key=True),
+    db.Index('ix_user_group_group_id', 'group_id', 'user_id')  # Khóa chính bắt đầu bằng user_id; tra thành viên theo nhóm cần index riêng
 )
 
 # Define the user_notification association table
+# is_seen là trạng thái đã đọc của từng người nhận (kể cả khi gửi theo nhóm)
 user_notification = db.Table('user_notification',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('notification_id', db.Integer, db.ForeignKey('notification.id'), primary_key=True)
+    db.Column('notification_id', db.Integer, db.ForeignKey('notification.id'), primary_key=True),
+    db.Column('is_seen', db.Boolean, nullable=False, default=False, server_default=db.false()),
+    db.Column('date_created', db.DateTime),  # Sao chép từ Notification.date_created để hộp thư sắp xếp trên chính bảng này
+    db.Index('ix_user_notification_inbox', 'user_id', 'date_created', 'notification_id'),
+    db.Index('ix_user_notification_unread', 'user_id', 'date_created', 'notification_id', sqlite_where=db.text('is_seen = 0')),
+    # Tìm người nhận của một thông báo theo thứ tự user_id; is_seen để đếm đã đọc mà không đọc bảng
+    db.Index('ix_user_notification_notification_id', 'notification_id', 'user_id', 'is_seen')
 )
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))  # scrypt của werkzeug dài 162 ký tự
     is_admin = db.Column(db.Boolean, default=False)
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Cập nhật tăng dần khi gửi/đọc
     groups = db.relationship('Group', secondary=user_group, backref='members')
     notifications = db.relationship('Notification', secondary=user_notification, backref='notification_recipients')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Qua thread pool có giới hạn như route đăng nhập; hash trống trả về False
+        return password_hasher.verify(self.password_hash, password)
 
 def get_vietnam_time():
     return datetime.now(tz=ZoneInfo("Asia/Ho_Chi_Minh"))
@@ -56,8 +338,104 @@ class Notification(db.Model):
     category = db.Column(db.String(50))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # Đảm bảo có cột này
     user = db.relationship('User', backref=db.backref('user_notifications', lazy=True))
-    file_name = db.Column(db.String(100))  # Lưu tên tệp
+    file_name = db.Column(db.String(100))  # Lưu tên tệp gốc
+    attachment_id = db.Column(db.Integer, db.ForeignKey('attachment.id'), nullable=True)
+    attachment = db.relationship('Attachment', backref=db.backref('notifications', lazy=True))
     date_created = db.Column(db.DateTime, default=get_vietnam_time)  # Lưu ngày giờ tạo
+    send_at = db.Column(db.DateTime)  # Giờ hẹn gửi (giờ Việt Nam); None = gửi ngay
+
+    # Hỗ trợ phân trang theo (date_created, id) giảm dần
+    __table_args__ = (
+        db.Index('ix_notification_date_created_id', 'date_created', 'id'),
+        db.Index('ix_notification_user_id', 'user_id', 'date_created', 'id'),  # Lịch sử đã gửi, phân trang
+    )
+
+# Chỉ mục toàn văn (FTS5) cho content, type, category. Bảng contentless nên dữ liệu
+# được ghi qua trigger; chữ đ/Đ được đổi thành d/D vì unicode61 không bỏ dấu chữ này.
+NOTIFICATION_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS notification_fts USING fts5(
+        content, type, category, content='', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS notification_fts_insert AFTER INSERT ON notification BEGIN
+        INSERT INTO notification_fts(rowid, content, type, category) VALUES (
+            new.id,
+            replace(replace(new.content, 'đ', 'd'), 'Đ', 'D'),
+            replace(replace(new.type, 'đ', 'd'), 'Đ', 'D'),
+            replace(replace(coalesce(new.category, ''), 'đ', 'd'), 'Đ', 'D'));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notification_fts_delete AFTER DELETE ON notification BEGIN
+        INSERT INTO notification_fts(notification_fts, rowid, content, type, category) VALUES (
+            'delete', old.id,
+            replace(replace(old.content, 'đ', 'd'), 'Đ', 'D'),
+            replace(replace(old.type, 'đ', 'd'), 'Đ', 'D'),
+            replace(replace(coalesce(old.category, ''), 'đ', 'd'), 'Đ', 'D'));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notification_fts_update AFTER UPDATE OF content, type, category ON notification BEGIN
+        INSERT INTO notification_fts(notification_fts, rowid, content, type, category) VALUES (
+            'delete', old.id,
+            replace(replace(old.content, 'đ', 'd'), 'Đ', 'D'),
+            replace(replace(old.type, 'đ', 'd'), 'Đ', 'D'),
+            replace(replace(coalesce(old.category, ''), 'đ', 'd'), 'Đ', 'D'));
+        INSERT INTO notification_fts(rowid, content, type, category) VALUES (
+            new.id,
+            replace(replace(new.content, 'đ', 'd'), 'Đ', 'D'),
+            replace(replace(new.type, 'đ', 'd'), 'Đ', 'D'),
+            replace(replace(coalesce(new.category, ''), 'đ', 'd'), 'Đ', 'D'));
+    END""",
+]
+
+# db.create_all() tạo kèm bảng FTS giống như migration
+for statement in NOTIFICATION_FTS_DDL:
+    event.listen(Notification.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+notification_fts = table('notification_fts', column('rowid'), column('rank'), column('notification_fts'))
+
+# Bảng trong cơ sở dữ liệu lưu trữ (ARCHIVE_DDL), dùng để chép và tìm kiếm thông báo đã lưu trữ
+archive_notification = table('notification', column('id'), column('content'), column('type'), column('category'),
+                             column('user_id'), column('file_name'), column('attachment_id'), column('date_created'),
+                             column('date_archived'), schema='archive')
+archive_history = table('notification_history', column('id'), column('notification_id'), column('sender_id'),
+                        column('recipient_id'), column('group_id'), column('date_sent'), column('is_seen'),
+                        schema='archive')
+archive_user_notification = table('user_notification', column('user_id'), column('notification_id'),
+                                  column('is_seen'), schema='archive')
+archive_fts = table('notification_fts', column('rowid'), column('content'), column('type'), column('category'),
+                    column('rank'), column('notification_fts'), schema='archive')
+
+class Attachment(db.Model):
+    # Nội dung tệp được lưu một lần theo mã băm; ref_count là số thông báo đang dùng
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    content_type = db.Column(db.String(100))
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def path(self):
+        return blob_path(self.sha256)
+
+class UploadSession(db.Model):
+    # Phiên tải lên theo đoạn; received là số byte đã ghi liên tục từ đầu tệp
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    file_name = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100))
+    size = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64))  # Mã băm do client khai báo, kiểm tra khi hoàn tất
+    received = db.Column(db.Integer, nullable=False, default=0)
+    attachment_id = db.Column(db.Integer, db.ForeignKey('attachment.id'))  # Có giá trị khi đã hoàn tất
+    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    date_updated = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    attachment = db.relationship('Attachment')
+
+    @property
+    def path(self):
+        return os.path.join(app.root_path, app.config['UPLOAD_PARTIAL_FOLDER'], f'{self.id}.part')
+
+    def to_dict(self):
+        return {'id': self.id, 'file_name': self.file_name, 'size': self.size, 'offset': self.received,
+                'complete': self.attachment_id is not None, 'attachment_id': self.attachment_id,
+                'chunk_size': app.config['UPLOAD_CHUNK_SIZE']}
 
 class NotificationHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -71,10 +449,54 @@ class NotificationHistory(db.Model):
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_notifications')
     recipient = db.relationship('User', foreign_keys=[recipient_id], backref='received_notifications')
     group = db.relationship('Group', back_populates='notifications')
+    __table_args__ = (
+        db.Index('ix_notification_history_recipient', 'recipient_id', 'notification_id', 'is_seen'),  # mark_as_seen
+        db.Index('ix_notification_history_sender', 'sender_id'),  # sent_notifications
+        db.Index('ix_notification_history_notification_id', 'notification_id'),  # Xóa thông báo
+    )
     
     def mark_as_seen(self):
+        # Không commit ở đây: người gọi commit một lần cho cả lô
         self.is_seen = True
-        db.session.commit()
+
+class NotificationEvent(db.Model):
+    # Nhật ký sự kiện dùng chung giữa các worker; id chỉ tăng nên dùng được làm cursor
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = {'sqlite_autoincrement': True}
+
+class DispatchJob(db.Model):
+    # Công việc gửi thông báo chạy nền; cursor là id người nhận lớn nhất đã ghi xong
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, db.ForeignKey('notification.id'), nullable=False)
+    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_ids = db.Column(db.Text, nullable=False, default='[]')  # Danh sách id dạng JSON
+    group_ids = db.Column(db.Text, nullable=False, default='[]')
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    cursor = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    locked_at = db.Column(db.DateTime)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    due_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # UTC; chỉ được nhận khi đã đến hạn
+    notification = db.relationship('Notification', backref=db.backref('dispatch_jobs', lazy=True))
+
+    __table_args__ = (
+        db.Index('ix_dispatch_job_due', 'status', 'due_at', 'id'),  # Nhận việc đến hạn, tìm hạn gần nhất
+        db.Index('ix_dispatch_job_sender_id', 'sender_id', 'status'),  # Tiến độ gửi trên trang đã gửi
+        db.Index('ix_dispatch_job_notification_id', 'notification_id'),  # Xóa/lưu trữ thông báo
+    )
+
+    @property
+    def progress(self):
+        if self.status == 'done':
+            return 100
+        return int(self.processed * 100 / self.total) if self.total else 0
 
 class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -86,23 +508,1342 @@ class Group(db.Model):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def blob_path(sha256):
+    # Chia thư mục theo 2 ký tự đầu để tránh một thư mục chứa quá nhiều tệp
+    return os.path.join(app.root_path, app.config['ATTACHMENT_FOLDER'], sha256[:2], sha256)
+
+def store_attachment(stream, content_type=None):
+    """Lưu nội dung stream vào kho theo SHA-256 và trả về Attachment tương ứng.
+
+    Tệp được băm trong lúc ghi ra tệp tạm theo từng đoạn; nếu nội dung đã có trong
+    kho thì tệp tạm bị xóa. Không commit và không tăng ref_count.
+    """
+    folder = os.path.join(app.root_path, app.config['ATTACHMENT_FOLDER'])
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            while True:
+                chunk = stream.read(app.config['ATTACHMENT_READ_SIZE'])
+                if not chunk:
+                    break
+                digest.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return move_into_store(temp_path, digest.hexdigest(), size, content_type)
+
+def move_into_store(temp_path, sha256, size, content_type=None):
+    """Đưa tệp đã băm vào kho và trả về Attachment; nếu nội dung đã có thì chỉ xóa tệp tạm.
+
+    Dòng attachment được ghi trước khi xem tệp trong kho: câu ghi giữ khóa ghi tới khi
+    người gọi commit, nên collect_unused_attachments (xóa tệp khi còn giữ khóa ghi) không
+    thể xóa tệp sau lần kiểm tra. Nếu tệp đã bị dọn trước đó thì khôi phục từ tệp tạm.
+    """
+    try:
+        attachment = register_blob(sha256, size, content_type)
+        path = blob_path(sha256)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return attachment
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        while chunk := source.read(app.config['ATTACHMENT_READ_SIZE']):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def register_blob(sha256, size, content_type=None):
+    # Tạo dòng attachment nếu chưa có (an toàn khi nhiều request cùng tải một tệp)
+    db.session.execute(insert(Attachment.__table__).prefix_with('OR IGNORE', dialect='sqlite').values(
+        sha256=sha256, size=size, content_type=content_type, ref_count=0, date_created=datetime.utcnow()))
+    return db.session.scalars(select(Attachment).where(Attachment.sha256 == sha256)).one()
+
+def link_attachment(notification, attachment, file_name):
+    # Tăng ref_count bằng UPDATE để an toàn khi nhiều request cùng dùng một tệp
+    notification.file_name = file_name
+    notification.attachment = attachment
+    db.session.execute(update(Attachment).where(Attachment.id == attachment.id).values(
+        ref_count=Attachment.ref_count + 1))
+
+def collect_unused_attachments(grace=None):
+    """Xóa các tệp đính kèm có ref_count = 0 (cùng ảnh thu nhỏ) đã tạo quá ATTACHMENT_GC_GRACE giây.
+
+    Khoảng chờ tránh xóa tệp vừa tải lên nhưng chưa kịp gắn vào thông báo. Tệp bị xóa khỏi
+    đĩa trước khi commit, lúc transaction còn giữ khóa ghi: lần dùng lại cùng nội dung
+    (move_into_store) phải chờ tới sau đó mới kiểm tra tệp và sẽ khôi phục nếu cần.
+    Trả về (số tệp, số byte).
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['ATTACHMENT_GC_GRACE'] if grace is None else grace)
+    candidates = db.session.scalars(select(Attachment.id).where(
+        Attachment.ref_count == 0, Attachment.date_created < cutoff,
+        ~exists().where(UploadSession.attachment_id == Attachment.id))).all()
+    removed = []
+    for chunk in chunked(candidates):
+        # Kiểm tra lại trong câu DELETE: tệp có thể vừa được dùng lại hoặc gắn vào phiên tải lên
+        removed += db.session.execute(delete(Attachment).where(
+            Attachment.id.in_(chunk), Attachment.ref_count == 0,
+            ~exists().where(UploadSession.attachment_id == Attachment.id)
+        ).returning(Attachment.sha256, Attachment.size)).all()
+    try:
+        for sha256, _ in removed:
+            for path in [blob_path(sha256)] + [derivatives.path(sha256, variant) for variant in app.config['DERIVATIVE_SIZES']]:
+                if os.path.exists(path):
+                    os.remove(path)
+    finally:
+        # Commit cả khi xóa tệp lỗi giữa chừng: dòng còn lại sẽ trỏ tới tệp đã mất
+        db.session.commit()
+    return len(removed), sum(size for _, size in removed)
+
+def attach_file(notification, file):
+    """Lưu tệp tải lên vào kho và gắn vào thông báo; không commit."""
+    attachment = store_attachment(file.stream, file.mimetype)
+    link_attachment(notification, attachment, file.filename)
+    if is_previewable(attachment.content_type):
+        derivatives.schedule(attachment.sha256)  # Tạo sẵn ảnh thu nhỏ ở tiến trình nền
+    return attachment
+
+def attach_form_file(notification):
+    """Gắn tệp của form gửi thông báo: tệp đã tải lên theo đoạn (upload_id) hoặc tệp gửi kèm."""
+    upload_id = request.form.get('upload_id')
+    if upload_id:
+        upload = db.session.get(UploadSession, upload_id)
+        # Chỉ người tải lên mới được dùng phiên của mình, và phiên phải đã hoàn tất
+        if upload is None or upload.user_id != current_user.id or upload.attachment is None:
+            abort(400, 'Upload not found or not complete')
+        link_attachment(notification, upload.attachment, upload.file_name)
+        db.session.delete(upload)
+        return upload.attachment
+    file = request.files.get('file')
+    if file:
+        return attach_file(notification, file)
+    return None
+
+def is_previewable(content_type):
+    return Image is not None and bool(content_type) and content_type.startswith('image/')
+
+def render_derivative(source, target, max_size):
+    """Chạy trong tiến trình con: thu nhỏ ảnh gốc thành JPEG, trả về kích thước tệp."""
+    with Image.open(source) as image:
+        image.draft('RGB', (max_size, max_size))  # Với JPEG: giải mã thẳng ở độ phân giải thấp
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+        with os.fdopen(fd, 'wb') as temp_file:
+            image.save(temp_file, 'JPEG', quality=80, optimize=True)
+    os.replace(temp_path, target)
+    return os.path.getsize(target)
+
+class DerivativeStore:
+    """Ảnh thu nhỏ/xem trước tạo trong process pool, lưu trên đĩa và dọn theo LRU.
+
+    Thời điểm truy cập gần nhất được ghi vào mtime của tệp; khi tổng dung lượng vượt
+    DERIVATIVE_CACHE_MAX_BYTES thì xóa các tệp cũ nhất.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pending = {}  # Đường dẫn đích -> Future đang tạo
+        self._lock = threading.Lock()
+
+    def folder(self):
+        return os.path.join(app.root_path, app.config['DERIVATIVE_FOLDER'])
+
+    def path(self, sha256, variant):
+        return os.path.join(self.folder(), f'{sha256}-{variant}.jpg')
+
+    def submit(self, sha256, variant):
+        target = self.path(sha256, variant)
+        with self._lock:
+            future = self._pending.get(target)
+            if future is None:
+                if self._executor is None:
+                    # spawn: không sao chép các luồng nền của tiến trình web sang tiến trình con
+                    self._executor = ProcessPoolExecutor(max_workers=app.config['DERIVATIVE_WORKERS'],
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                os.makedirs(self.folder(), exist_ok=True)
+                future = self._executor.submit(render_derivative, blob_path(sha256), target,
+                                               app.config['DERIVATIVE_SIZES'][variant])
+                self._pending[target] = future
+                future.add_done_callback(lambda done: self._finished(target, done))
+        return future
+
+    def _finished(self, target, future):
+        with self._lock:
+            self._pending.pop(target, None)
+        if future.exception() is None:
+            self.evict()
+        else:
+            app.logger.warning('Could not render %s: %s', target, future.exception())
+
+    def schedule(self, sha256):
+        for variant in app.config['DERIVATIVE_SIZES']:
+            if not os.path.exists(self.path(sha256, variant)):
+                self.submit(sha256, variant)
+
+    def get(self, sha256, variant, timeout):
+        """Trả về đường dẫn ảnh đã tạo (chờ tối đa ``timeout`` giây nếu chưa có), hoặc None."""
+        target = self.path(sha256, variant)
+        if not os.path.exists(target):
+            try:
+                self.submit(sha256, variant).result(timeout)
+            except Exception:
+                return None
+        try:
+            os.utime(target)  # Đánh dấu vừa được dùng cho LRU
+        except FileNotFoundError:
+            return None
+        return target
+
+    def evict(self):
+        limit = app.config['DERIVATIVE_CACHE_MAX_BYTES']
+        with os.scandir(self.folder()) as entries:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                     for entry in entries if entry.name.endswith('.jpg')]
+        total = sum(size for _, size, _ in files)
+        if total <= limit:
+            return
+        # Xóa tới khi còn 90% giới hạn để không phải dọn lại sau mỗi ảnh mới
+        for _, size, path in sorted(files):
+            if total <= limit * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+derivatives = DerivativeStore()
+app.jinja_env.globals['is_previewable'] = is_previewable
+
+def parse_ids(values):
+    # Chuyển danh sách id dạng chuỗi từ form sang int, bỏ giá trị trùng hoặc không hợp lệ
+    ids = set()
+    for value in values:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return sorted(ids)
+
+def chunked(ids, size=None):
+    size = size or app.config['FANOUT_CHUNK_SIZE']
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+def set_group_members(group_id, member_ids):
+    """Đồng bộ thành viên nhóm với danh sách id mong muốn bằng một INSERT và một DELETE.
+
+    So sánh theo id kiểu int nên lưu lại form không đổi thì không ghi gì. Id người dùng
+    không tồn tại bị bỏ qua. Không commit; trả về (id đã thêm, id đã xóa).
+    """
+    wanted = set(parse_ids(member_ids))
+    current = set(db.session.scalars(select(user_group.c.user_id).where(user_group.c.group_id == group_id)))
+    added, removed = sorted(wanted - current), sorted(current - wanted)
+    if added:
+        values = func.json_each(json.dumps(added)).table_valued('value')
+        db.session.execute(insert(user_group).from_select(
+            ['user_id', 'group_id'], select(User.id, literal(group_id)).where(User.id.in_(select(values.c.value)))))
+    if removed:
+        values = func.json_each(json.dumps(removed)).table_valued('value')
+        db.session.execute(delete(user_group).where(
+            user_group.c.group_id == group_id, user_group.c.user_id.in_(select(values.c.value))))
+    return added, removed
+
+IMPORT_COLUMNS = {
+    'username': 'username', 'tên đăng nhập': 'username',
+    'email': 'email',
+    'password': 'password', 'mật khẩu': 'password',
+    'groups': 'groups', 'nhóm': 'groups',
+    'is_admin': 'is_admin', 'quản trị': 'is_admin',
+}
+
+def read_import_rows(stream, file_name):
+    """Đọc lần lượt từng dòng của tệp CSV/XLSX, trả về (số dòng, dict theo IMPORT_COLUMNS).
+
+    Dòng đầu là tiêu đề; cột không nhận ra bị bỏ qua. Không đọc cả tệp vào bộ nhớ.
+    """
+    if file_name.lower().endswith('.xlsx'):
+        if openpyxl is None:
+            raise ValueError('openpyxl is required to import .xlsx files')
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    else:
+        rows = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = [IMPORT_COLUMNS.get(str(name or '').strip().lower()) for name in next(rows, ())]
+    if 'username' not in header or 'email' not in header:
+        raise ValueError('Header must contain username and email columns')
+    for row_number, values in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in values):
+            continue  # Bỏ dòng trống
+        yield row_number, {key: str(value).strip() if value is not None else ''
+                           for key, value in zip(header, values) if key}
+
+def ensure_groups(names):
+    # Tạo các nhóm chưa có trong một câu lệnh, trả về {tên: id}
+    values = func.json_each(json.dumps(sorted(names))).table_valued('value')
+    db.session.execute(insert(Group.__table__).prefix_with('OR IGNORE', dialect='sqlite').from_select(
+        ['name'], select(values.c.value)))
+    return dict(db.session.execute(select(Group.name, Group.id).where(Group.name.in_(select(values.c.value)))).all())
+
+def import_user_batch(batch, hashes):
+    """Ghi một lô người dùng hợp lệ cùng thành viên nhóm; không commit."""
+    rows = [{'username': row['username'], 'email': row['email'], 'password_hash': password_hash,
+             'is_admin': row.get('is_admin', '').lower() in ('1', 'true', 'yes', 'x', 'có'), 'unread_count': 0}
+            for (_, row), password_hash in zip(batch, hashes)]
+    user_ids = dict(db.session.execute(
+        insert(User.__table__).returning(User.__table__.c.username, User.__table__.c.id), rows).all())
+
+    memberships = [(user_ids[row['username']], name.strip())
+                   for _, row in batch for name in row.get('groups', '').replace(',', ';').split(';') if name.strip()]
+    if memberships:
+        group_ids = ensure_groups({name for _, name in memberships})
+        db.session.execute(insert(user_group).prefix_with('OR IGNORE', dialect='sqlite'),
+                           [{'user_id': user_id, 'group_id': group_ids[name]} for user_id, name in memberships])
+
+def import_users(rows, executor=None):
+    """Nhập người dùng theo lô IMPORT_BATCH_SIZE dòng, mỗi lô một transaction.
+
+    Mật khẩu được băm song song trong process pool. Dòng lỗi không chặn các dòng khác;
+    trả về (số người dùng đã tạo, danh sách (số dòng, username, lỗi)).
+    """
+    created, errors = 0, []
+    seen_usernames, seen_emails = set(), set()
+
+    def write_batch(batch):
+        nonlocal created
+        # Bỏ các dòng trùng với người dùng đã có trong cơ sở dữ liệu
+        usernames = func.json_each(json.dumps([row['username'] for _, row in batch])).table_valued('value')
+        emails = func.json_each(json.dumps([row['email'] for _, row in batch])).table_valued('value')
+        taken = db.session.execute(select(User.username, User.email).where(or_(
+            User.username.in_(select(usernames.c.value)), User.email.in_(select(emails.c.value))))).all()
+        taken_usernames = {username for username, _ in taken}
+        taken_emails = {email for _, email in taken}
+        valid = []
+        for row_number, row in batch:
+            if row['username'] in taken_usernames or row['email'] in taken_emails:
+                errors.append((row_number, row['username'], 'username or email already exists'))
+            else:
+                valid.append((row_number, row))
+        if not valid:
+            return
+
+        hashes = list(executor.map(password_hasher.generator(), [row['password'] for _, row in valid], chunksize=64))
+        try:
+            import_user_batch(valid, hashes)
+            db.session.commit()
+            created += len(valid)
+        except IntegrityError as exc:
+            db.session.rollback()
+            errors.extend((row_number, row['username'], f'batch rejected: {exc.orig}') for row_number, row in valid)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=app.config['IMPORT_WORKERS'],
+                                       mp_context=multiprocessing.get_context('spawn'))
+    try:
+        batch = []
+        for row_number, row in rows:
+            username, email = row.get('username', ''), row.get('email', '')
+            if not username or not email or not row.get('password'):
+                errors.append((row_number, username, 'username, email and password are required'))
+            elif '@' not in email:
+                errors.append((row_number, username, 'invalid email'))
+            elif username in seen_usernames or email in seen_emails:
+                errors.append((row_number, username, 'duplicate in file'))
+            else:
+                seen_usernames.add(username)
+                seen_emails.add(email)
+                batch.append((row_number, row))
+                if len(batch) >= app.config['IMPORT_BATCH_SIZE']:
+                    write_batch(batch)
+                    batch = []
+        if batch:
+            write_batch(batch)
+    finally:
+        if own_executor:
+            executor.shutdown()
+    errors.sort(key=lambda error: error[0])
+    return created, errors
+
+def write_import_report(errors, stream):
+    writer = csv.writer(stream)
+    writer.writerow(['row', 'username', 'error'])
+    writer.writerows(errors)
+
+# Các cột khi xuất: mỗi thông báo một dòng, hoặc mỗi người nhận một dòng (kèm trạng thái đã đọc)
+EXPORT_COLUMNS = {
+    'notifications': ['id', 'date_created', 'sender', 'type', 'category', 'content', 'file_name'],
+    'receipts': ['notification_id', 'date_created', 'sender', 'type', 'category', 'recipient_id', 'recipient', 'is_seen'],
+}
+
+def parse_export_range(start=None, end=None):
+    # Ngày dạng YYYY-MM-DD, end được tính trọn ngày; ValueError nếu sai định dạng
+    start = datetime.strptime(start, '%Y-%m-%d') if start else None
+    end = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else None
+    return start, end
+
+def export_rows(kind, start=None, end=None):
+    """Sinh từng dòng (tuple theo EXPORT_COLUMNS[kind]) theo thứ tự thời gian tạo.
+
+    Kết quả được đọc từng lô EXPORT_BATCH_SIZE dòng (yield_per) nên bộ nhớ không tăng theo số dòng.
+    """
+    sender = User.__table__.alias('sender')
+    columns = [Notification.date_created, sender.c.username.label('sender'), Notification.type, Notification.category]
+    if kind == 'notifications':
+        stmt = select(Notification.id, *columns, Notification.content, Notification.file_name)
+    else:
+        recipient = User.__table__.alias('recipient')
+        stmt = select(Notification.id, *columns, user_notification.c.user_id, recipient.c.username,
+                      user_notification.c.is_seen).join(
+            user_notification, user_notification.c.notification_id == Notification.id
+        ).join(recipient, recipient.c.id == user_notification.c.user_id)
+    stmt = stmt.outerjoin(sender, sender.c.id == Notification.user_id)
+    if start:
+        stmt = stmt.where(Notification.date_created >= start)
+    if end:
+        stmt = stmt.where(Notification.date_created < end)
+    order = [Notification.date_created, Notification.id]
+    if kind == 'receipts':
+        order.append(user_notification.c.user_id)
+    result = db.session.execute(stmt.order_by(*order).execution_options(yield_per=app.config['EXPORT_BATCH_SIZE']))
+    for row in result:
+        yield tuple(row)
+
+def export_chunks(rows, columns, fmt='csv', compress=False):
+    """Chuyển các dòng thành từng khối bytes CSV hoặc JSON Lines, tùy chọn nén gzip.
+
+    Mỗi lần chỉ giữ khoảng EXPORT_CHUNK_SIZE ký tự trong bộ đệm.
+    """
+    chunk_size = app.config['EXPORT_CHUNK_SIZE']
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: định dạng gzip
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+    for row in rows:
+        if fmt == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n')
+        if buffer.tell() >= chunk_size:
+            data = buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = buffer.getvalue().encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+def resolve_recipients(user_ids=(), group_ids=()):
+    """Trả về id người nhận (đã sắp xếp, không trùng) từ danh sách người dùng và nhóm."""
+    recipients = set()
+    for chunk in chunked(parse_ids(user_ids)):
+        recipients.update(db.session.scalars(select(User.id).where(User.id.in_(chunk))))
+    for chunk in chunked(parse_ids(group_ids)):
+        recipients.update(db.session.scalars(select(user_group.c.user_id).where(user_group.c.group_id.in_(chunk))))
+    return sorted(recipients)
+
+def record_group_history(notification_id, sender_id, group_ids):
+    # Gửi tới nhóm: một dòng lịch sử cho mỗi nhóm thay vì cho từng thành viên
+    now = datetime.utcnow()
+    for chunk in chunked(parse_ids(group_ids)):
+        db.session.execute(insert(NotificationHistory.__table__).from_select(
+            ['notification_id', 'sender_id', 'group_id', 'date_sent', 'is_seen'],
+            select(literal(notification_id), literal(sender_id), Group.id,
+                   literal(now, db.DateTime), literal(False)).where(Group.id.in_(chunk))))
+
+def fan_out_chunk(notification_id, sender_id, recipient_ids, direct_ids=frozenset()):
+    """Ghi user_notification, lịch sử gửi trực tiếp và bộ đếm chưa đọc cho một đoạn người nhận.
+
+    Danh sách id được truyền thành một mảng JSON và mở rộng bằng json_each, nên mỗi
+    câu lệnh chỉ có một tham số. Các đoạn của cùng một thông báo phải rời nhau.
+    Không commit; trả về số liên kết đã thêm.
+    """
+    if not recipient_ids:
+        return 0
+    now = datetime.utcnow()
+    recipients = func.json_each(json.dumps(recipient_ids)).table_valued('value')
+    date_created = select(Notification.date_created).where(Notification.id == notification_id).scalar_subquery()
+    result = db.session.execute(insert(user_notification).prefix_with('OR IGNORE', dialect='sqlite').from_select(
+        ['user_id', 'notification_id', 'date_created'],
+        select(recipients.c.value, literal(notification_id), date_created)))
+
+    # Gửi tới từng người dùng: một dòng lịch sử cho mỗi người nhận
+    direct = [user_id for user_id in recipient_ids if user_id in direct_ids]
+    if direct:
+        direct_recipients = func.json_each(json.dumps(direct)).table_valued('value')
+        db.session.execute(insert(NotificationHistory.__table__).from_select(
+            ['notification_id', 'sender_id', 'recipient_id', 'date_sent', 'is_seen'],
+            select(literal(notification_id), literal(sender_id), direct_recipients.c.value,
+                   literal(now, db.DateTime), literal(False))))
+
+    db.session.execute(update(User).where(User.id.in_(select(recipients.c.value))).values(
+        unread_count=User.unread_count + 1).execution_options(synchronize_session=False))
+    return result.rowcount
+
+def fan_out_notification(notification_id, sender_id, user_ids=(), group_ids=()):
+    """Gửi ngay một thông báo tới mọi người nhận, theo từng đoạn DISPATCH_CHUNK_SIZE.
+
+    Không commit: người gọi quyết định ranh giới transaction. Trả về số dòng
+    user_notification đã được thêm.
+    """
+    record_group_history(notification_id, sender_id, group_ids)
+    direct_ids = set(parse_ids(user_ids))
+    inserted = 0
+    for chunk in chunked(resolve_recipients(user_ids, group_ids), app.config['DISPATCH_CHUNK_SIZE']):
+        inserted += fan_out_chunk(notification_id, sender_id, chunk, direct_ids)
+    return inserted
+
+def retry_when_locked(operation):
+    # SQLite trả về "database is locked" khi có transaction ghi khác; lùi dần rồi thử lại
+    retries = app.config['DISPATCH_LOCKED_RETRIES']
+    for attempt in range(retries + 1):
+        try:
+            return operation()
+        except OperationalError as e:
+            db.session.rollback()
+            if 'database is locked' not in str(e) or attempt == retries:
+                raise
+            time.sleep(min(0.05 * 2 ** attempt, 2))
+
+def enqueue_dispatch(notification, sender_id, user_ids=(), group_ids=(), due_at=None):
+    """Tạo công việc gửi nền cho thông báo, chạy từ ``due_at`` (UTC, mặc định ngay); không commit."""
+    record_group_history(notification.id, sender_id, group_ids)
+    job = DispatchJob(notification=notification, sender_id=sender_id, due_at=due_at or datetime.utcnow(),
+                      user_ids=json.dumps(parse_ids(user_ids)), group_ids=json.dumps(parse_ids(group_ids)))
+    db.session.add(job)
+    return job
+
+def run_dispatch_job(job_id):
+    """Xử lý một công việc đã được nhận, mỗi đoạn người nhận là một transaction.
+
+    Cursor được lưu cùng transaction với đoạn vừa ghi, nên chạy lại sau sự cố sẽ
+    tiếp tục từ đoạn kế tiếp mà không gửi trùng. Công việc chỉ có một đoạn (thường gặp
+    với thông báo hẹn giờ) được ghi và hoàn tất trong cùng một transaction.
+    """
+    job = db.session.get(DispatchJob, job_id)
+    if job is None:  # Thông báo đã bị xóa trong lúc chờ gửi
+        return
+    user_ids = json.loads(job.user_ids)
+    direct_ids = set(user_ids)
+    recipients = resolve_recipients(user_ids, json.loads(job.group_ids))
+    remaining = [user_id for user_id in recipients if user_id > job.cursor]
+    chunks = list(chunked(remaining, app.config['DISPATCH_CHUNK_SIZE']))
+    if len(chunks) > 1:
+        job.total = job.processed + len(remaining)
+        db.session.commit()
+
+    for chunk in chunks:
+        def write_chunk():
+            job = db.session.get(DispatchJob, job_id)
+            fan_out_chunk(job.notification_id, job.sender_id, chunk, direct_ids)
+            job.cursor = chunk[-1]
+            job.processed += len(chunk)
+            job.locked_at = datetime.utcnow()
+            if len(chunks) == 1:
+                job.total = job.processed
+                finish_dispatch_job(job)
+            db.session.commit()
+        retry_when_locked(write_chunk)
+
+    if len(chunks) != 1:
+        def finish():
+            finish_dispatch_job(db.session.get(DispatchJob, job_id))
+            db.session.commit()
+        retry_when_locked(finish)
+    event_bus.wake()
+
+def finish_dispatch_job(job):
+    # Không commit: người gọi commit cùng đoạn người nhận cuối (nếu có)
+    job.status = 'done'
+    job.last_error = None
+    publish_notification(job.notification)
+
+class Dispatcher:
+    """Nhóm luồng nền nhận công việc từ bảng dispatch_job và thực hiện gửi.
+
+    Công việc hẹn giờ nằm trong cùng bảng với due_at; chỉ mục (status, due_at) cho phép
+    nhận việc đến hạn và tìm hạn gần nhất mà không duyệt cả bảng. Luồng nền ngủ đến hạn
+    gần nhất (tối đa poll_interval giây, để thấy việc do tiến trình khác tạo).
+    """
+
+    def __init__(self, workers, lease_seconds, max_attempts, retry_seconds, retry_max_seconds, poll_interval=5):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if not self._threads:
+                for number in range(self.workers):
+                    thread = threading.Thread(target=self._run, name=f'dispatch-{number}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def wake(self):
+        self._wake.set()
+
+    def claim(self, job_id=None):
+        # Nhận một công việc đang chờ hoặc bị bỏ dở (quá hạn lease) bằng một câu UPDATE;
+        # ``job_id`` chỉ nhận đúng công việc đó (nếu nó đã đến hạn)
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.lease_seconds)
+        claimable = or_(and_(DispatchJob.status == 'pending', DispatchJob.due_at <= now),
+                        and_(DispatchJob.status == 'running', DispatchJob.locked_at < stale))
+        candidate = job_id if job_id is not None else select(DispatchJob.id).where(claimable).order_by(
+            DispatchJob.due_at, DispatchJob.id).limit(1).scalar_subquery()
+        job_id = db.session.execute(update(DispatchJob).where(DispatchJob.id == candidate, claimable).values(
+            status='running', locked_at=datetime.utcnow(), attempts=DispatchJob.attempts + 1
+        ).returning(DispatchJob.id)).scalar()
+        db.session.commit()
+        return job_id
+
+    def run_next(self, job_id=None):
+        job_id = retry_when_locked(functools.partial(self.claim, job_id))
+        if job_id is None:
+            return False
+        try:
+            run_dispatch_job(job_id)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('Dispatch job %s failed', job_id)
+            job = db.session.get(DispatchJob, job_id)
+            if job is not None:
+                job.last_error = str(e)
+                # Trả về hàng đợi để thử lại sau một khoảng lùi dần, trừ khi đã quá số lần cho phép;
+                # dời due_at để việc lỗi không bị nhận lại ngay và chặn các việc đến hạn khác
+                job.status = 'failed' if job.attempts >= self.max_attempts else 'pending'
+                job.due_at = datetime.utcnow() + timedelta(seconds=self.backoff(job.attempts))
+                db.session.commit()
+        return True
+
+    def backoff(self, attempts):
+        return min(self.retry_seconds * 2 ** max(attempts - 1, 0), self.retry_max_seconds)
+
+    def seconds_until_due(self):
+        # Thời gian chờ đến công việc hẹn giờ gần nhất, tối đa poll_interval
+        due_at = db.session.scalar(select(func.min(DispatchJob.due_at)).where(DispatchJob.status == 'pending'))
+        if due_at is None:
+            return self.poll_interval
+        return min(max((due_at - datetime.utcnow()).total_seconds(), 0.05), self.poll_interval)
+
+    def _run(self):
+        while True:
+            timeout = self.poll_interval
+            with app.app_context():
+                try:
+                    while self.run_next():
+                        pass
+                    timeout = self.seconds_until_due()
+                except Exception:
+                    app.logger.exception('Dispatcher loop failed')
+                finally:
+                    db.session.remove()
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+dispatcher = Dispatcher(app.config['DISPATCH_WORKERS'], app.config['DISPATCH_LEASE_SECONDS'],
+                        app.config['DISPATCH_MAX_ATTEMPTS'], app.config['DISPATCH_RETRY_SECONDS'],
+                        app.config['DISPATCH_RETRY_MAX_SECONDS'])
+
+def parse_send_at(value):
+    """Đọc ô datetime-local (giờ Việt Nam). Trả về None nếu để trống hoặc không ở tương lai; ValueError nếu sai định dạng."""
+    if not value:
+        return None
+    send_at = datetime.strptime(value, '%Y-%m-%dT%H:%M').replace(tzinfo=ZoneInfo("Asia/Ho_Chi_Minh"))
+    return send_at if send_at > get_vietnam_time() else None
+
+def submit_dispatch(notification, sender_id, user_ids=(), group_ids=()):
+    """Ghi thông báo và công việc gửi, commit rồi giao cho luồng nền (hoặc chạy ngay nếu DISPATCH_WORKERS = 0).
+
+    Nếu thông báo có send_at, công việc chỉ được nhận khi đến giờ đó.
+    """
+    due_at = notification.send_at.astimezone(timezone.utc).replace(tzinfo=None) if notification.send_at else None
+    job = enqueue_dispatch(notification, sender_id, user_ids, group_ids, due_at=due_at)
+    db.session.commit()
+    if dispatcher.workers:
+        dispatcher.start()
+        dispatcher.wake()
+    else:
+        # Chạy đúng công việc vừa tạo, không phải việc đến hạn sớm nhất của người khác
+        dispatcher.run_next(job.id)
+    return job
+
+def mark_notifications_seen(user_id, notification_ids=None, before=None):
+    """Đánh dấu đã đọc thông báo của người dùng, trả về số thông báo vừa chuyển sang đã đọc.
+
+    ``notification_ids`` giới hạn theo danh sách id, ``before`` là cursor hộp thư
+    (thông báo ở vị trí đó và mọi thông báo cũ hơn). Không truyền cả hai nghĩa là tất cả.
+    Không commit: người gọi quyết định ranh giới transaction.
+    """
+    if notification_ids is not None:
+        conditions = [[user_notification.c.notification_id.in_(chunk)] for chunk in chunked(parse_ids(notification_ids))]
+    elif before is not None:
+        # Chỉ duyệt liên kết của chính người dùng, theo khóa sắp xếp của hộp thư
+        conditions = [[tuple_(user_notification.c.date_created, user_notification.c.notification_id) <= before]]
+    else:
+        conditions = [[]]
+
+    changed = []
+    for condition in conditions:
+        changed += db.session.scalars(update(user_notification).where(
+            user_notification.c.user_id == user_id,
+            user_notification.c.is_seen == False,
+            *condition
+        ).values(is_seen=True).returning(user_notification.c.notification_id)).all()
+
+    if changed:
+        # Giữ trạng thái hiển thị cho người gửi trong lịch sử gửi trực tiếp, chỉ với các thông báo vừa đọc
+        for chunk in chunked(changed):
+            db.session.execute(update(NotificationHistory).where(
+                NotificationHistory.recipient_id == user_id,
+                NotificationHistory.is_seen == False,
+                NotificationHistory.notification_id.in_(chunk),
+            ).values(is_seen=True))
+        db.session.execute(update(User).where(User.id == user_id).values(
+            unread_count=func.max(User.unread_count - len(changed), 0)))
+    return len(changed)
+
+class NotificationBroker:
+    """Phân phối sự kiện tới các kết nối SSE của từng người dùng trong tiến trình hiện tại."""
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._subscribers = {}  # user_id -> tập các hàng đợi của người dùng đó
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[user_id]
+
+    def subscribed_user_ids(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, user_ids, event):
+        with self._lock:
+            targets = [subscription for user_id in user_ids for subscription in self._subscribers.get(user_id, ())]
+        for subscription in targets:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # Client đọc chậm: bỏ sự kiện cũ nhất để hàng đợi luôn có giới hạn
+                try:
+                    subscription.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscription.put_nowait(event)
+                except queue.Full:
+                    pass
+
+class EventBus:
+    """Chuyển sự kiện thông báo tới mọi worker trên máy qua bảng notification_event.
+
+    Người gửi ghi sự kiện trong cùng transaction với thông báo; mỗi tiến trình có
+    một luồng đọc các dòng mới theo id rồi đẩy vào broker cục bộ của nó.
+    """
+
+    def __init__(self, broker, poll_interval, retention):
+        self.broker = broker
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.cursor = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                # Chỉ nhận sự kiện phát sinh sau khi tiến trình bắt đầu lắng nghe
+                self.cursor = db.session.scalar(select(func.max(NotificationEvent.id))) or 0
+                self._thread = threading.Thread(target=self._run, name='event-bus', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        # Sự kiện do chính tiến trình này ghi: đọc ngay thay vì chờ chu kỳ kế tiếp
+        self._wake.set()
+
+    def _run(self):
+        with app.app_context():
+            polls = 0
+            while True:
+                try:
+                    self.poll()
+                    polls += 1
+                    if polls % 1000 == 0:
+                        self.prune()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Event bus poll failed')
+                finally:
+                    db.session.remove()
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def poll(self, limit=500):
+        events = db.session.execute(select(
+            NotificationEvent.id, NotificationEvent.notification_id, NotificationEvent.payload
+        ).where(NotificationEvent.id > self.cursor).order_by(NotificationEvent.id).limit(limit)).all()
+        if not events:
+            return 0
+        self.cursor = events[-1].id
+
+        connected = self.broker.subscribed_user_ids()
+        if connected:
+            recipients = {}
+            notification_ids = [event.notification_id for event in events]
+            for chunk in chunked(sorted(connected)):
+                rows = db.session.execute(select(user_notification.c.notification_id, user_notification.c.user_id).where(
+                    user_notification.c.notification_id.in_(notification_ids),
+                    user_notification.c.user_id.in_(chunk)))
+                for notification_id, user_id in rows:
+                    recipients.setdefault(notification_id, []).append(user_id)
+            for event in events:
+                if event.notification_id in recipients:
+                    self.broker.publish(recipients[event.notification_id], json.loads(event.payload))
+        return len(events)
+
+    def prune(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        db.session.execute(delete(NotificationEvent).where(NotificationEvent.date_created < cutoff))
+        db.session.commit()
+
+broker = NotificationBroker(app.config['SSE_QUEUE_SIZE'])
+event_bus = EventBus(broker, app.config['EVENT_BUS_POLL_SECONDS'], app.config['EVENT_BUS_RETENTION_SECONDS'])
+
+def notification_event(notification):
+    return {
+        'id': notification.id,
+        'type': notification.type,
+        'category': notification.category,
+        'content': notification.content,
+        'sender': notification.user.username if notification.user else None,
+        'date_created': notification.date_created.isoformat() if notification.date_created else None,
+    }
+
+def publish_notification(notification):
+    """Ghi sự kiện vào nhật ký dùng chung; gọi trước commit để sự kiện đi cùng transaction gửi."""
+    db.session.add(NotificationEvent(notification_id=notification.id, payload=json.dumps(notification_event(notification))))
+
+def fts_query(text):
+    # Mỗi từ được đặt trong dấu nháy kép (tránh cú pháp FTS5) và khớp theo tiền tố
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in text.split())
+
+def visible_to(user_id):
+    # Thông báo người dùng đã gửi hoặc đã nhận
+    return or_(Notification.user_id == user_id, exists().where(
+        user_notification.c.notification_id == Notification.id, user_notification.c.user_id == user_id))
+
+def search_page(user_id, text, page=1, page_size=None):
+    """Tìm thông báo của người dùng, xếp theo độ liên quan; trả về (kết quả, còn trang sau hay không)."""
+    page_size = page_size or app.config['SEARCH_PAGE_SIZE']
+    stmt = select(Notification).where(visible_to(user_id))
+    if not text.strip():
+        stmt = stmt.order_by(Notification.date_created.desc(), Notification.id.desc())
+    elif app.config['SEARCH_BACKEND'] == 'fts':
+        stmt = stmt.join(notification_fts, notification_fts.c.rowid == Notification.id).where(
+            notification_fts.c.notification_fts.op('MATCH')(fts_query(text))
+        ).order_by(notification_fts.c.rank)
+    else:
+        pattern = f'%{text}%'
+        stmt = stmt.where(
+            Notification.content.like(pattern) | Notification.type.like(pattern) | Notification.category.like(pattern)
+        ).order_by(Notification.date_created.desc(), Notification.id.desc())
+
+    rows = db.session.scalars(stmt.limit(page_size + 1).offset((page - 1) * page_size)).all()
+    return rows[:page_size], len(rows) > page_size
+
+def search_archive(user_id, text, page=1, page_size=None):
+    """Tìm trong các thông báo đã lưu trữ mà người dùng đã gửi hoặc đã nhận; giống search_page.
+
+    Chỉ chạy khi người dùng yêu cầu nên không làm chậm tìm kiếm thông thường.
+    """
+    page_size = page_size or app.config['SEARCH_PAGE_SIZE']
+    stmt = select(archive_notification).where(or_(archive_notification.c.user_id == user_id, exists().where(
+        archive_user_notification.c.notification_id == archive_notification.c.id,
+        archive_user_notification.c.user_id == user_id)))
+    if text.strip():
+        stmt = stmt.join(archive_fts, archive_fts.c.rowid == archive_notification.c.id).where(
+            archive_fts.c.notification_fts.op('MATCH')(fts_query(text))
+        ).order_by(archive_fts.c.rank)
+    else:
+        stmt = stmt.order_by(archive_notification.c.date_created.desc(), archive_notification.c.id.desc())
+    rows = db.session.execute(stmt.limit(page_size + 1).offset((page - 1) * page_size)).all()
+    return rows[:page_size], len(rows) > page_size
+
+def fold_d(expression):
+    # Giống trigger FTS của bảng chính: unicode61 không bỏ dấu chữ đ/Đ
+    return func.replace(func.replace(expression, 'đ', 'd'), 'Đ', 'D')
+
+def archive_notifications(before, batch_size=None):
+    """Chuyển thông báo tạo trước ``before`` cùng lịch sử và trạng thái đọc sang cơ sở dữ liệu lưu trữ.
+
+    Mỗi lô ARCHIVE_BATCH_SIZE thông báo là một transaction: chép sang archive, giảm
+    unread_count của người nhận rồi xóa khỏi các bảng chính. Bản lưu trữ giữ attachment_id nên
+    ref_count của tệp đính kèm không đổi: tệp không bị collect_unused_attachments xóa.
+    Với WAL, commit qua hai tệp không nguyên tử nên việc chép dùng OR IGNORE/OR REPLACE:
+    chạy lại sau lỗi không tạo bản trùng. Thông báo còn công việc gửi chưa xong được bỏ qua.
+    Trả về số thông báo đã chuyển.
+    """
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    archived = 0
+    while True:
+        ids = db.session.scalars(select(Notification.id).where(
+            Notification.date_created < before,
+            Notification.id.notin_(select(DispatchJob.notification_id).where(
+                DispatchJob.status.in_(('pending', 'running', 'failed')))),
+        ).order_by(Notification.date_created, Notification.id).limit(batch_size)).all()
+        if not ids:
+            return archived
+        batch = select(func.json_each(json.dumps(ids)).table_valued('value').c.value)
+
+        # Chỉ mục FTS5 contentless không kiểm tra trùng rowid: chỉ thêm thông báo chưa có trong archive.
+        # Bảng archive cùng tên với bảng chính nên phải đặt alias khi dùng chung một câu lệnh
+        archived_before = archive_notification.alias('archived')
+        db.session.execute(insert(archive_fts).from_select(
+            ['rowid', 'content', 'type', 'category'],
+            select(Notification.id, fold_d(Notification.content), fold_d(Notification.type),
+                   fold_d(func.coalesce(Notification.category, ''))).where(
+                Notification.id.in_(batch), ~exists().where(archived_before.c.id == Notification.id))))
+        db.session.execute(insert(archive_notification).prefix_with('OR IGNORE').from_select(
+            ['id', 'content', 'type', 'category', 'user_id', 'file_name', 'attachment_id', 'date_created',
+             'date_archived'],
+            select(Notification.id, Notification.content, Notification.type, Notification.category,
+                   Notification.user_id, Notification.file_name, Notification.attachment_id,
+                   Notification.date_created, literal(datetime.utcnow())).where(Notification.id.in_(batch))))
+        db.session.execute(insert(archive_history).prefix_with('OR REPLACE').from_select(
+            ['id', 'notification_id', 'sender_id', 'recipient_id', 'group_id', 'date_sent', 'is_seen'],
+            select(NotificationHistory.id, NotificationHistory.notification_id, NotificationHistory.sender_id,
+                   NotificationHistory.recipient_id, NotificationHistory.group_id, NotificationHistory.date_sent,
+                   NotificationHistory.is_seen).where(NotificationHistory.notification_id.in_(batch))))
+        db.session.execute(insert(archive_user_notification).prefix_with('OR REPLACE').from_select(
+            ['user_id', 'notification_id', 'is_seen'],
+            select(user_notification.c.user_id, user_notification.c.notification_id, user_notification.c.is_seen)
+            .where(user_notification.c.notification_id.in_(batch))))
+
+        # Giảm bộ đếm chưa đọc theo số dòng bị chuyển đi
+        unread = select(func.count()).where(
+            user_notification.c.user_id == User.id, user_notification.c.notification_id.in_(batch),
+            user_notification.c.is_seen == False).scalar_subquery()
+        db.session.execute(update(User).where(User.id.in_(
+            select(user_notification.c.user_id).where(user_notification.c.notification_id.in_(batch),
+                                                      user_notification.c.is_seen == False)
+        )).values(unread_count=func.max(User.unread_count - unread, 0)))
+
+        db.session.execute(delete(user_notification).where(user_notification.c.notification_id.in_(batch)))
+        db.session.execute(delete(NotificationHistory).where(NotificationHistory.notification_id.in_(batch)))
+        db.session.execute(delete(DispatchJob).where(DispatchJob.notification_id.in_(batch)))
+        db.session.execute(delete(Notification).where(Notification.id.in_(batch)))
+        db.session.commit()
+        archived += len(ids)
+
+def compact_database():
+    """Trả dung lượng trống của tệp chính cho hệ điều hành; trả về số byte đã giải phóng.
+
+    Lần đầu chuyển sang auto_vacuum=INCREMENTAL bằng một VACUUM đầy đủ (chép lại cả tệp);
+    các lần sau chỉ chạy incremental_vacuum, nhanh và không chặn người đọc lâu.
+    """
+    db.session.remove()  # Trả kết nối ghi về pool: VACUUM không chạy được trong transaction
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        size = lambda: cursor.execute('PRAGMA page_count').fetchone()[0] * cursor.execute('PRAGMA page_size').fetchone()[0]
+        before = size()
+        if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            cursor.execute('VACUUM')
+        else:
+            cursor.executescript('PRAGMA incremental_vacuum')  # execute() chỉ giải phóng một trang mỗi lần
+        if cursor.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        freed = max(before - size(), 0)  # Lần chuyển đầu thêm trang ptrmap nên có thể lớn hơn
+        cursor.close()
+    finally:
+        connection.close()
+    return freed
+
+def encode_cursor(date_created, notification_id):
+    return f"{date_created.strftime('%Y%m%d%H%M%S%f')}-{notification_id}"
+
+def decode_cursor(cursor):
+    # Cursor không hợp lệ được coi như trang đầu tiên
+    try:
+        stamp, notification_id = cursor.split('-')
+        return datetime.strptime(stamp, '%Y%m%d%H%M%S%f'), int(notification_id)
+    except (AttributeError, ValueError):
+        return None
+
+def inbox_page(user_id, cursor=None, page_size=None, unread_only=False):
+    """Trả về một trang hộp thư (mới nhất trước) và cursor của trang kế tiếp.
+
+    Mỗi dòng gồm ``Notification``, ``sender_name``, ``is_seen`` của người dùng này và
+    ``attachment_type``,
+    lấy trong một truy vấn duy nhất để template không phải lazy-load ``history``.
+    """
+    page_size = page_size or app.config['INBOX_PAGE_SIZE']
+    stmt = select(
+        Notification,
+        User.username.label('sender_name'),
+        user_notification.c.is_seen.label('is_seen'),
+        Attachment.content_type.label('attachment_type'),
+    ).join(
+        user_notification, user_notification.c.notification_id == Notification.id
+    ).outerjoin(
+        User, User.id == Notification.user_id
+    ).outerjoin(
+        Attachment, Attachment.id == Notification.attachment_id
+    ).where(user_notification.c.user_id == user_id)
+
+    if unread_only:
+        stmt = stmt.where(user_notification.c.is_seen == False)
+
+    # Cursor và thứ tự dùng cột của user_notification để đi thẳng theo ix_user_notification_inbox
+    position = decode_cursor(cursor)
+    if position:
+        stmt = stmt.where(tuple_(user_notification.c.date_created, user_notification.c.notification_id) < position)
+
+    # Lấy thêm một dòng để biết còn trang sau hay không
+    stmt = stmt.order_by(user_notification.c.date_created.desc(),
+                         user_notification.c.notification_id.desc()).limit(page_size + 1)
+    rows = db.session.execute(stmt).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1].Notification
+        next_cursor = encode_cursor(last.date_created, last.id)
+    return rows, next_cursor
+
+def sent_page(sender_id, cursor=None, page_size=None):
+    """Trả về một trang thông báo đã gửi (mới nhất trước) và cursor của trang kế tiếp.
+
+    Mỗi mục là dict gồm ``notification``, ``groups`` (tên nhóm nhận), ``delivered``, ``seen``
+    và phần trăm tương ứng. Số đã nhận/đã đọc của cả trang được tính bằng một truy vấn
+    GROUP BY trên user_notification; danh sách từng người nhận được tải riêng khi cần
+    (xem sent_recipients). Tổng người nhận của công việc gửi chưa xong dùng làm mẫu số khi đang gửi.
+    """
+    page_size = page_size or app.config['SENT_PAGE_SIZE']
+    stmt = select(Notification).where(Notification.user_id == sender_id)
+    position = decode_cursor(cursor)
+    if position:
+        stmt = stmt.where(tuple_(Notification.date_created, Notification.id) < position)
+    stmt = stmt.order_by(Notification.date_created.desc(), Notification.id.desc()).limit(page_size + 1)
+    notifications = db.session.scalars(stmt).all()
+    next_cursor = None
+    if len(notifications) > page_size:
+        notifications = notifications[:page_size]
+        next_cursor = encode_cursor(notifications[-1].date_created, notifications[-1].id)
+
+    ids = [notification.id for notification in notifications]
+    counts, groups, totals = {}, {}, {}
+    if ids:
+        counts = {row.notification_id: row for row in db.session.execute(
+            select(
+                user_notification.c.notification_id,
+                func.count().label('delivered'),
+                func.coalesce(func.sum(user_notification.c.is_seen), 0).label('seen'),
+            ).where(user_notification.c.notification_id.in_(ids)).group_by(user_notification.c.notification_id)
+        )}
+        for notification_id, name in db.session.execute(
+            select(NotificationHistory.notification_id, Group.name).distinct()
+            .join(Group, Group.id == NotificationHistory.group_id)
+            .where(NotificationHistory.notification_id.in_(ids))
+        ):
+            groups.setdefault(notification_id, []).append(name)
+        totals = dict(db.session.execute(select(DispatchJob.notification_id, DispatchJob.total).where(
+            DispatchJob.notification_id.in_(ids), DispatchJob.status != 'done')).all())
+    entries = []
+    for notification in notifications:
+        row = counts.get(notification.id)
+        delivered, seen = (row.delivered, row.seen) if row else (0, 0)
+        expected = max(totals.get(notification.id) or 0, delivered)
+        entries.append({
+            'notification': notification,
+            'groups': groups.get(notification.id, []),
+            'delivered': delivered,
+            'seen': seen,
+            'delivered_percent': round(delivered * 100 / expected) if expected else 0,
+            'seen_percent': round(seen * 100 / delivered) if delivered else 0,
+        })
+    return entries, next_cursor
+
+def sent_recipients(notification_id, after=0, limit=None, seen=None):
+    """Một trang người nhận của thông báo theo user_id tăng dần (``after`` là id cuối của trang trước)."""
+    limit = limit or app.config['RECIPIENTS_PAGE_SIZE']
+    stmt = select(User.id, User.username, user_notification.c.is_seen).join(
+        user_notification, user_notification.c.user_id == User.id
+    ).where(user_notification.c.notification_id == notification_id, user_notification.c.user_id > after)
+    if seen is not None:
+        stmt = stmt.where(user_notification.c.is_seen == seen)
+    rows = db.session.execute(stmt.order_by(user_notification.c.user_id).limit(limit + 1)).all()
+    next_after = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_after
+
+@app.before_request
+def start_background_workers():
+    # Tiếp tục các công việc gửi còn dở sau khi khởi động lại
+    if dispatcher.workers:
+        dispatcher.start()
+
+class CachedUser(UserMixin):
+    """Người dùng hiện tại dựng từ cache danh tính, không gắn với session SQLAlchemy."""
+
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+
+    @functools.cached_property
+    def unread_count(self):
+        # Thay đổi liên tục nên không cache giữa các request; chỉ truy vấn khi template cần
+        return db.session.scalar(select(User.unread_count).where(User.id == self.id))
+
+class UserCache:
+    """Cache LRU có TTL cho (id, username, is_admin), dùng bởi user_loader.
+
+    Mỗi tiến trình có cache riêng: các route sửa người dùng gọi invalidate() trong
+    tiến trình của mình, còn ở tiến trình khác dữ liệu cũ tồn tại tối đa USER_CACHE_TTL giây.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> (hết hạn lúc, username, is_admin)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return CachedUser(user_id, entry[1], entry[2])
+            self.misses += 1
+
+        row = db.session.execute(select(User.username, User.is_admin).where(User.id == user_id)).first()
+        if row is None:
+            return None
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, row.username, bool(row.is_admin))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return CachedUser(user_id, row.username, bool(row.is_admin))
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+user_cache = UserCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
+
+class Histogram:
+    # Histogram kiểu Prometheus: đếm theo từng ngưỡng, cộng dồn khi xuất
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """Số liệu theo endpoint trong bộ nhớ của tiến trình, xuất theo định dạng text của Prometheus.
+
+    Mỗi worker giữ số liệu riêng và gắn nhãn pid, nên Prometheus cần scrape từng worker.
+    """
+
+    def __init__(self):
+        self.requests = {}  # (endpoint, method, status) -> số request
+        self.latency = {}  # endpoint -> Histogram thời gian xử lý
+        self.queries = {}  # endpoint -> Histogram số câu lệnh SQL mỗi request
+        self.query_seconds = {}  # endpoint -> tổng thời gian SQL
+        self.slow_queries = {}  # endpoint -> số câu lệnh chậm
+        self._lock = threading.Lock()
+
+    def record_request(self, endpoint, method, status, seconds, queries, query_seconds):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault(endpoint, Histogram(app.config['METRICS_LATENCY_BUCKETS'])).observe(seconds)
+            self.queries.setdefault(endpoint, Histogram(app.config['METRICS_QUERY_BUCKETS'])).observe(queries)
+            self.query_seconds[endpoint] = self.query_seconds.get(endpoint, 0) + query_seconds
+
+    def record_slow_query(self, endpoint):
+        with self._lock:
+            self.slow_queries[endpoint] = self.slow_queries.get(endpoint, 0) + 1
+
+    def render(self, gauges=()):
+        pid = os.getpid()
+        lines = []
+
+        def labels(**values):
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                       for value in values.values())
+            return '{' + ','.join(f'{name}="{value}"' for name, value in zip(values, escaped)) + '}'
+
+        def header(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, histograms):
+            for endpoint, histogram in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{labels(pid=pid, endpoint=endpoint, le=bound)} {cumulative}')
+                lines.append(f'{name}_bucket{labels(pid=pid, endpoint=endpoint, le="+Inf")} {histogram.count}')
+                lines.append(f'{name}_sum{labels(pid=pid, endpoint=endpoint)} {histogram.sum}')
+                lines.append(f'{name}_count{labels(pid=pid, endpoint=endpoint)} {histogram.count}')
+
+        with self._lock:
+            header('http_requests_total', 'counter', 'Requests by endpoint, method and status.')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{labels(pid=pid, endpoint=endpoint, method=method, status=status)} {count}')
+            header('http_request_duration_seconds', 'histogram', 'Request handling time by endpoint.')
+            histogram('http_request_duration_seconds', self.latency)
+            header('db_queries_per_request', 'histogram', 'SQL statements executed per request.')
+            histogram('db_queries_per_request', self.queries)
+            header('db_query_seconds_total', 'counter', 'Time spent executing SQL by endpoint.')
+            for endpoint, seconds in sorted(self.query_seconds.items()):
+                lines.append(f'db_query_seconds_total{labels(pid=pid, endpoint=endpoint)} {seconds}')
+            header('db_slow_queries_total', 'counter', 'Statements slower than SLOW_QUERY_SECONDS.')
+            for endpoint, count in sorted(self.slow_queries.items()):
+                lines.append(f'db_slow_queries_total{labels(pid=pid, endpoint=endpoint)} {count}')
+
+        for name, kind, help_text, samples in gauges:
+            header(name, kind, help_text)
+            for sample_labels, value in samples:
+                lines.append(f'{name}{labels(pid=pid, **sample_labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def current_endpoint():
+    # Câu lệnh chạy ngoài request (luồng gửi nền, event bus) được gom vào nhãn "background"
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'background'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.metrics_started
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_queries += 1
+        g.metrics_query_seconds += elapsed
+    threshold = app.config['SLOW_QUERY_SECONDS']
+    if threshold is not None and elapsed >= threshold:
+        endpoint = current_endpoint()
+        app.logger.warning('Slow query (%.3fs) in %s: %s', elapsed, endpoint, statement)
+        if app.config['METRICS_ENABLED']:
+            metrics.record_slow_query(endpoint)
+
+@app.before_request
+def start_request_timer():
+    if app.config['METRICS_ENABLED']:
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_seconds = 0
+
+@app.after_request
+def record_request_metrics(response):
+    # Với response dạng stream (SSE) chỉ đo tới lúc gửi header
+    if 'metrics_started' in g:
+        metrics.record_request(request.endpoint or 'unknown', request.method, response.status_code,
+                               time.perf_counter() - g.metrics_started, g.metrics_queries, g.metrics_query_seconds)
+        g.pop('metrics_started')
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(error):
+    # Lỗi không được xử lý thì after_request không chạy
+    if error is not None and 'metrics_started' in g:
+        metrics.record_request(request.endpoint or 'unknown', request.method, 500,
+                               time.perf_counter() - g.metrics_started, g.metrics_queries, g.metrics_query_seconds)
+
+def render_inbox(notifications, next_cursor, unread_only):
+    # seen_cursor: vị trí dòng mới nhất trên trang, giới hạn trên cho "Đánh dấu tất cả đã đọc"
+    newest = notifications[0].Notification if notifications else None
+    seen_cursor = encode_cursor(newest.date_created, newest.id) if newest else None
+    return render_template('index.html', notifications=notifications, next_cursor=next_cursor,
+                           seen_cursor=seen_cursor, unread_only=unread_only)
 
 @app.route('/')
 @login_required
 def index():
-    # Sắp xếp thông báo theo thời gian giảm dần
-    notifications = sorted(current_user.notifications, key=lambda n: n.date_created, reverse=True)
-    return render_template('index.html', notifications=notifications)
+    # Thông báo được sắp xếp và phân trang ngay trong SQL
+    unread_only = request.args.get('unread') == '1'
+    notifications, next_cursor = inbox_page(current_user.id, request.args.get('cursor'), unread_only=unread_only)
+    return render_inbox(notifications, next_cursor, unread_only)
 
 @app.route('/index')
 def home():
     if current_user.is_authenticated:
-        # Sắp xếp các thông báo theo thời gian giảm dần
-        notifications = sorted(current_user.notifications, key=lambda n: n.date_created, reverse=True)
-        return render_template('index.html', notifications=notifications)
+        unread_only = request.args.get('unread') == '1'
+        notifications, next_cursor = inbox_page(current_user.id, request.args.get('cursor'), unread_only=unread_only)
+        return render_inbox(notifications, next_cursor, unread_only)
     return render_template('index.html')
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -111,7 +1852,7 @@ def register():
         username = request.form['username']
         email = request.form['email']
         password = request.form['password']
-        hashed_password = generate_password_hash(password)
+        hashed_password = password_hasher.hash_async(password)
         new_user = User(username=username, email=email, password_hash=hashed_password)
         db.session.add(new_user)
         db.session.commit()
@@ -125,7 +1866,16 @@ def login():
         username = request.form['username']
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and password_hasher.verify(user.password_hash, password)
+            if valid and password_hasher.needs_rehash(user.password_hash):
+                # Chính sách băm đã đổi: băm lại bằng phương thức mới khi còn có mật khẩu gốc
+                user.password_hash = password_hasher.hash_async(password)
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash('Server is busy, please try again in a moment', 'warning')
+            return render_template('login.html'), 503
+        if valid:
             login_user(user)
             return redirect(url_for('index'))
         flash('Invalid credentials', 'danger')
@@ -157,8 +1907,9 @@ def edit_user(user_id):
         user.username = request.form['username']
         user.email = request.form['email']
         if request.form['password']:
-            user.password_hash = generate_password_hash(request.form['password'])
+            user.password_hash = password_hasher.hash_async(request.form['password'])
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('User updated successfully!', 'success')
         return redirect(url_for('manage_users'))
     return render_template('edit_user.html', user=user)
@@ -172,9 +1923,62 @@ def delete_user(user_id):
     user = User.query.get(user_id)
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user_id)
     flash('User deleted successfully!', 'success')
     return redirect(url_for('manage_users'))
 
+@app.route('/import_users', methods=['GET', 'POST'])
+@login_required
+def import_users_upload():
+    if not current_user.is_admin:
+        flash('Admin access required', 'danger')
+        return redirect(url_for('index'))
+
+    created, errors = None, []
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file:
+            flash('No file selected!', 'danger')
+            return redirect(url_for('import_users_upload'))
+        try:
+            created, errors = import_users(read_import_rows(file.stream, file.filename))
+        except ValueError as e:
+            flash(f'Error: {str(e)}', 'danger')
+            return redirect(url_for('import_users_upload'))
+        if request.form.get('report') == 'csv':
+            report = io.StringIO()
+            write_import_report(errors, report)
+            return Response(report.getvalue(), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename=import-errors.csv'})
+        flash(f'Imported {created} users ({len(errors)} rows with errors).', 'success' if not errors else 'warning')
+    return render_template('import_users.html', created=created, errors=errors, report_limit=500)
+
+@app.route('/export_notifications')
+@login_required
+def export_notifications():
+    # Xuất cho kiểm toán: ?kind=notifications|receipts&format=csv|jsonl&start=YYYY-MM-DD&end=YYYY-MM-DD
+    if not current_user.is_admin:
+        flash('Admin access required', 'danger')
+        return redirect(url_for('index'))
+
+    kind = request.args.get('kind', 'notifications')
+    fmt = request.args.get('format', 'csv')
+    if kind not in EXPORT_COLUMNS or fmt not in ('csv', 'jsonl'):
+        abort(400)
+    try:
+        start, end = parse_export_range(request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        abort(400)
+
+    # Không có Content-Length: response được gửi theo từng khối (chunked) trong lúc đọc cơ sở dữ liệu
+    compress = 'gzip' in request.accept_encodings
+    headers = {'Content-Disposition': f'attachment; filename={kind}.{fmt}', 'Vary': 'Accept-Encoding'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    chunks = export_chunks(export_rows(kind, start, end), EXPORT_COLUMNS[kind], fmt, compress)
+    return Response(stream_with_context(chunks), headers=headers,
+                    mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+
 @app.route('/create_group', methods=['GET', 'POST'])
 @login_required
 def create_group():
@@ -189,14 +1993,12 @@ def create_group():
         # Tạo nhóm mới
         new_group = Group(name=name)
         db.session.add(new_group)
-        db.session.commit()
-
-        # Thêm người dùng vào nhóm
-        for user_id in selected_users:
-            user = User.query.get(user_id)
-            new_group.users.append(user)
+        db.session.flush()
 
+        # Thêm người dùng vào nhóm bằng một câu lệnh
+        added, _ = set_group_members(new_group.id, selected_users)
         db.session.commit()
+        user_cache.invalidate(*added)
         flash('Group created successfully!', 'success')
         return redirect(url_for('manage_groups'))
 
@@ -234,27 +2036,18 @@ def edit_group(group_id):
         group.name = request.form['name']
         # Thêm hoặc xóa thành viên
         selected_users = request.form.getlist('members')  # Nhận danh sách người dùng được chọn
-        # Cập nhật danh sách thành viên
-        current_members = set(user.id for user in group.users)
-        new_members = set(selected_users)
-        
-        # Thêm người dùng mới vào nhóm
-        for user_id in new_members - current_members:
-            user = User.query.get(user_id)
-            group.users.append(user)
-        
-        # Xóa người dùng khỏi nhóm
-        for user_id in current_members - new_members:
-            user = User.query.get(user_id)
-            group.users.remove(user)
+        # Chỉ ghi phần chênh lệch giữa thành viên hiện tại và danh sách mới
+        added, removed = set_group_members(group.id, selected_users)
 
         db.session.commit()
+        user_cache.invalidate(*added, *removed)
         flash('Group updated successfully!', 'success')
         return redirect(url_for('manage_groups'))
     
     # Lấy danh sách người dùng để hiển thị
     users = User.query.all()
-    return render_template('edit_group.html', group=group, users=users)
+    member_ids = set(db.session.scalars(select(user_group.c.user_id).where(user_group.c.group_id == group.id)))
+    return render_template('edit_group.html', group=group, users=users, member_ids=member_ids)
 
 
 @app.route('/remove_user_from_group/<int:group_id>/<int:user_id>', methods=['POST'])
@@ -271,6 +2064,7 @@ def remove_user_from_group(group_id, user_id):
         if user in group.users:
             group.users.remove(user)
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash(f'User {user.username} removed from group {group.name} successfully!', 'success')
         else:
             flash(f'User {user.username} is not a member of this group.', 'danger')
@@ -294,6 +2088,7 @@ def add_user_to_group(group_id):
         if user not in group.users:
             group.users.append(user)
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash(f'User {user.username} added to group {group.name} successfully!', 'success')
         else:
             flash(f'User {user.username} is already a member of this group.', 'warning')
@@ -314,12 +2109,14 @@ def delete_group(group_id):
     
     # Kiểm tra xem nhóm có tồn tại hay không
     if group:
+        member_ids = db.session.scalars(select(user_group.c.user_id).where(user_group.c.group_id == group_id)).all()
         # Xóa các bản ghi liên quan trong bảng phụ user_group trước
         db.session.query(user_group).filter_by(group_id=group_id).delete(synchronize_session='fetch')
 
         # Xóa nhóm
         db.session.delete(group)
         db.session.commit()
+        user_cache.invalidate(*member_ids)
 
         flash(f'Group "{group.name}" deleted successfully!', 'success')
     else:
@@ -338,22 +2135,15 @@ def create_notification():
         content = request.form['content']
         notification_type = request.form['type']
         category = request.form['category']
-        file = request.files['file']
-        
-        # Lưu tệp vào thư mục tạm
-        if file:
-            file_name = file.filename
-            file.save(f'uploads/{file_name}')  # Lưu tệp tin vào thư mục uploads
-        else:
-            file_name = None
 
         new_notification = Notification(
             content=content,
             type=notification_type,
             category=category,
-            user=current_user,
-            file_name=file_name
+            user_id=current_user.id
         )
+        # Lưu tệp vào kho đính kèm (mỗi nội dung chỉ lưu một lần)
+        attach_form_file(new_notification)
         db.session.add(new_notification)
         db.session.commit()
         flash('Notification created successfully!', 'success')
@@ -375,55 +2165,39 @@ def send_notification_to_user():
         content = request.form['content']
         category = request.form['category']
         user_ids = request.form.getlist('user_ids')  # Lấy danh sách người dùng đã chọn
-        file = request.files.get('file')  # Lấy tệp đính kèm (nếu có)
         
         # Kiểm tra nếu không có người dùng nào được chọn
         if not user_ids:
             flash('No users selected!', 'danger')
             return redirect(url_for('send_notification_to_user'))
+        try:
+            send_at = parse_send_at(request.form.get('send_at'))  # Để trống: gửi ngay
+        except ValueError:
+            flash('Invalid send time!', 'danger')
+            return redirect(url_for('send_notification_to_user'))
 
-        # Lưu tệp nếu có
-        file_name = None
-        if file:
-            # Kiểm tra nếu thư mục uploads không tồn tại
-            upload_folder = 'uploads'
-            if not os.path.exists(upload_folder):
-                os.makedirs(upload_folder)
-
-            file_name = file.filename
-            file.save(os.path.join(upload_folder, file_name))  # Lưu tệp tin vào thư mục uploads
-        
-        # Tạo thông báo mới
+        # Tạo thông báo mới; thông báo hẹn giờ mang thời điểm gửi để đứng đúng chỗ trong hộp thư
         new_notification = Notification(
             type=title,
             content=content,
             category=category,
-            file_name=file_name,
-            user=current_user  # Gán user_id của người gửi
+            user_id=current_user.id,  # Gán user_id của người gửi
+            send_at=send_at,
+            date_created=send_at or get_vietnam_time()
         )
         
         try:
+            # Gắn tệp đã tải lên trước hoặc tệp gửi kèm (mỗi nội dung chỉ lưu một lần)
+            attach_form_file(new_notification)
             db.session.add(new_notification)
-            db.session.commit()
-
-            
-            # Gửi thông báo tới những người dùng đã chọn
-            users = User.query.filter(User.id.in_(user_ids)).all()
-            for user in users:
-                # Thêm thông báo vào bảng liên kết giữa User và Notification
-                user.notifications.append(new_notification)  # Liên kết người dùng với thông báo
-                db.session.flush()  # Đảm bảo rằng sự thay đổi được ghi lại trước khi commit
-
-                # Lưu lịch sử gửi thông báo vào bảng NotificationHistory
-                history = NotificationHistory(
-                    notification_id=new_notification.id,
-                    sender_id=current_user.id,  # Người gửi là người hiện tại
-                    recipient_id=user.id,  # Người nhận
-                    date_sent=datetime.utcnow()  # Thời gian gửi
-                )
-                db.session.add(history)
-            db.session.commit()
-            flash('Notification sent to selected users!', 'success')
+            db.session.flush()  # Lấy id thông báo trước khi tạo công việc gửi
+
+            # Việc ghi cho từng người nhận được thực hiện ở luồng nền
+            submit_dispatch(new_notification, current_user.id, user_ids=user_ids)
+            if send_at:
+                flash(f"Notification scheduled for {send_at.strftime('%Y-%m-%d %H:%M')}!", 'success')
+            else:
+                flash('Notification queued for delivery to selected users!', 'success')
         except Exception as e:
             db.session.rollback()  # Nếu có lỗi, rollback lại các thay đổi
             flash(f'Error: {str(e)}', 'danger')
@@ -444,43 +2218,33 @@ def send_notification_to_group():
         content = request.form['content']
         notification_type = request.form['category']  # Loại thông báo (có thể được tùy chỉnh thêm)
         group_ids = request.form.getlist('group_ids')  # Lấy danh sách nhóm đã chọn
-        file = request.files.get('file')  # Lấy tệp đính kèm (nếu có)
-        
-        # Lưu tệp nếu có
-        file_name = None
-        if file:
-            file_name = file.filename
-            file.save(f'uploads/{file_name}')  # Lưu tệp vào thư mục uploads
+        try:
+            send_at = parse_send_at(request.form.get('send_at'))  # Để trống: gửi ngay
+        except ValueError:
+            flash('Invalid send time!', 'danger')
+            return redirect(url_for('send_notification_to_group'))
 
-        # Tạo thông báo mới
+        # Tạo thông báo mới; thông báo hẹn giờ mang thời điểm gửi để đứng đúng chỗ trong hộp thư
         new_notification = Notification(
             type=type,
             category=notification_type, 
             content=content,
-            file_name=file_name,
-            user=current_user  # Thêm người tạo thông báo
+            user_id=current_user.id,  # Thêm người tạo thông báo
+            send_at=send_at,
+            date_created=send_at or get_vietnam_time()
         )
 
+        # Gắn tệp đã tải lên trước hoặc tệp gửi kèm (mỗi nội dung chỉ lưu một lần)
+        attach_form_file(new_notification)
         db.session.add(new_notification)
-        db.session.commit()
-
-        # Gửi thông báo tới các nhóm đã chọn và ghi lại lịch sử thông báo
-        for group_id in group_ids:
-            group = Group.query.get(group_id)  # Lấy nhóm
-            for user in group.users:  # Lấy tất cả thành viên trong nhóm
-                user.notifications.append(new_notification)  # Thêm thông báo cho người dùng
-
-            # Lưu lịch sử gửi thông báo cho nhóm
-            history_entry = NotificationHistory(
-                notification=new_notification,
-                group_id = group.id,  # Lưu tên nhóm thay vì tên người nhận
-                date_sent=datetime.utcnow(),
-                sender=current_user
-            )
-            db.session.add(history_entry)
+        db.session.flush()  # Lấy id thông báo trước khi tạo công việc gửi
 
-        db.session.commit()
-        flash('Notification created and sent to selected groups!', 'success')
+        # Ghi lịch sử nhóm ngay, việc ghi cho từng thành viên được thực hiện ở luồng nền
+        submit_dispatch(new_notification, current_user.id, group_ids=group_ids)
+        if send_at:
+            flash(f"Notification scheduled for {send_at.strftime('%Y-%m-%d %H:%M')}!", 'success')
+        else:
+            flash('Notification created and queued for the selected groups!', 'success')
         return redirect(url_for('send_notification_to_group'))
 
     # Hiển thị form gửi thông báo
@@ -488,42 +2252,289 @@ def send_notification_to_group():
     return render_template('send_notification_to_group.html', groups=groups)
 
 '''----------------------------------------------------------------------------------------------------------------------------------------------------'''
-@app.route('/download/<filename>')
-def download_file(filename):
+# Tải tệp lớn theo từng đoạn: tạo phiên, PUT từng đoạn với header Upload-Offset (và tùy chọn
+# Upload-Checksum), rồi hoàn tất để kiểm tra mã băm của cả tệp. Khi mất kết nối, client hỏi lại offset bằng GET và tiếp tục từ đó.
+def get_upload_or_404(upload_id):
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != current_user.id:
+        abort(404)
+    return upload
+
+@app.route('/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    file_name, size, sha256 = data.get('file_name'), data.get('size'), data.get('sha256')
+    if not isinstance(file_name, str) or not file_name.strip():
+        return jsonify(error='file_name is required'), 400
+    if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+        return jsonify(error='size must be a non-negative integer'), 400
+    if size > app.config['UPLOAD_MAX_BYTES']:
+        return jsonify(error='file too large', max_bytes=app.config['UPLOAD_MAX_BYTES']), 413
+    if sha256 is not None and not (isinstance(sha256, str) and len(sha256) == 64
+                                   and all(c in '0123456789abcdef' for c in sha256.lower())):
+        return jsonify(error='sha256 must be a hex digest'), 400
+
+    upload = UploadSession(user_id=current_user.id, file_name=file_name.strip(), size=size,
+                           sha256=sha256.lower() if sha256 else None,
+                           content_type=data.get('content_type') or mimetypes.guess_type(file_name)[0])
+    db.session.add(upload)
+    db.session.flush()
+    os.makedirs(os.path.dirname(upload.path), exist_ok=True)
+    open(upload.path, 'wb').close()
+    db.session.commit()
+    return jsonify(upload.to_dict()), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    return jsonify(get_upload_or_404(upload_id).to_dict())
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    # Thân request là dữ liệu thô của đoạn, ghi thẳng vào tệp tạm mà không qua bộ nhớ
+    upload = get_upload_or_404(upload_id)
+    if upload.attachment_id is not None:
+        return jsonify(error='upload already complete'), 409
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset != upload.received:
+        return jsonify(error='offset mismatch', offset=upload.received), 409
+    if request.content_length is None:
+        return jsonify(error='Content-Length is required'), 411
+    if offset + request.content_length > upload.size:
+        return jsonify(error='chunk exceeds declared size', offset=upload.received), 413
+
+    # Upload-Checksum: "sha256 <hex>" của riêng đoạn này; sai thì đoạn không được tính
+    checksum = request.headers.get('Upload-Checksum', '').partition(' ')
+    if checksum[0] and checksum[0] != 'sha256':
+        return jsonify(error='unsupported checksum algorithm'), 400
+    digest = hashlib.sha256()
+    written = 0
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+        with open(upload.path, 'r+b') as part:
+            part.seek(offset)
+            try:
+                while chunk := request.stream.read(app.config['ATTACHMENT_READ_SIZE']):
+                    digest.update(chunk)
+                    part.write(chunk)
+                    written += len(chunk)
+            except ClientDisconnected:
+                pass  # Giữ lại phần đã nhận để client tiếp tục từ offset mới
     except FileNotFoundError:
-        flash('File not found.', 'danger')
-        return redirect(url_for('index'))
+        abort(404)
+    if checksum[0] and (written != request.content_length or digest.hexdigest() != checksum[2].strip().lower()):
+        return jsonify(error='checksum mismatch', offset=upload.received), 422
+
+    # Điều kiện received == offset: nếu hai request cùng ghi một đoạn thì chỉ một request được tính
+    changed = db.session.execute(update(UploadSession).where(
+        UploadSession.id == upload.id, UploadSession.received == offset
+    ).values(received=offset + written, date_updated=datetime.utcnow())).rowcount
+    db.session.commit()
+    if not changed:
+        db.session.refresh(upload)
+        return jsonify(error='offset mismatch', offset=upload.received), 409
+    db.session.refresh(upload)
+    return jsonify(upload.to_dict())
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    # Kiểm tra mã băm rồi đưa tệp vào kho; id phiên được dùng làm upload_id khi gửi thông báo
+    upload = get_upload_or_404(upload_id)
+    if upload.attachment_id is not None:
+        return jsonify(upload.to_dict())
+    if upload.received != upload.size:
+        return jsonify(error='upload incomplete', offset=upload.received), 409
+
+    sha256 = file_sha256(upload.path)
+    if upload.sha256 and sha256 != upload.sha256:
+        # Nội dung hỏng: bắt đầu lại từ đầu
+        open(upload.path, 'wb').close()
+        upload.received = 0
+        db.session.commit()
+        return jsonify(error='checksum mismatch', sha256=sha256, offset=0), 422
+
+    upload.attachment = move_into_store(upload.path, sha256, upload.size, upload.content_type)
+    upload.sha256 = sha256
+    upload.date_updated = datetime.utcnow()
+    db.session.commit()
+    if is_previewable(upload.attachment.content_type):
+        derivatives.schedule(sha256)
+    return jsonify(upload.to_dict())
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_upload(upload_id):
+    upload = get_upload_or_404(upload_id)
+    if os.path.exists(upload.path):
+        os.remove(upload.path)
+    db.session.delete(upload)
+    db.session.commit()
+    return '', 204
+
+'''----------------------------------------------------------------------------------------------------------------------------------------------------'''
+def can_view_notification(notification, user):
+    # Người gửi, người nhận hoặc quản trị viên
+    if user.is_admin or notification.user_id == user.id:
+        return True
+    return db.session.scalar(select(exists().where(
+        user_notification.c.notification_id == notification.id, user_notification.c.user_id == user.id)))
+
+def attachment_response(attachment, download_name):
+    """Trả tệp trong kho với ETag là mã băm, hỗ trợ 304 và Range, cache lâu dài."""
+    mode = app.config['ATTACHMENT_SENDFILE']
+    if mode == 'x-accel-redirect':
+        # nginx đọc tệp và xử lý Range; worker Python chỉ trả header
+        response = Response(mimetype=attachment.content_type or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = app.config['ATTACHMENT_ACCEL_PREFIX'] + f'{attachment.sha256[:2]}/{attachment.sha256}'
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        response.set_etag(attachment.sha256)
+        response.last_modified = attachment.date_created
+        response.make_conditional(request)
+    else:
+        response = send_file(attachment.path, mimetype=attachment.content_type, as_attachment=True,
+                             download_name=download_name, conditional=True, etag=attachment.sha256,
+                             last_modified=attachment.date_created, max_age=app.config['ATTACHMENT_CACHE_MAX_AGE'])
+    # Tệp cần đăng nhập: chỉ trình duyệt được cache, proxy dùng chung thì không
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['ATTACHMENT_CACHE_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/preview/<int:notification_id>/<variant>')
+@login_required
+def preview_file(notification_id, variant):
+    # Ảnh thu nhỏ ('thumb') hoặc ảnh xem trước cỡ web ('preview') của tệp ảnh đính kèm
+    notification = Notification.query.get_or_404(notification_id)
+    attachment = notification.attachment
+    if (variant not in app.config['DERIVATIVE_SIZES'] or attachment is None
+            or not is_previewable(attachment.content_type) or not can_view_notification(notification, current_user)):
+        abort(404)
+    path = derivatives.get(attachment.sha256, variant, app.config['DERIVATIVE_WAIT_SECONDS'])
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype='image/jpeg', conditional=True, etag=f'{attachment.sha256}-{variant}',
+                         max_age=app.config['ATTACHMENT_CACHE_MAX_AGE'])
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/download/<int:notification_id>')
+@login_required
+def download_file(notification_id):
+    notification = Notification.query.get_or_404(notification_id)
+    if not can_view_notification(notification, current_user):
+        abort(404)
+    try:
+        if notification.attachment:
+            # Nội dung lấy từ kho theo mã băm, tên tải về là tên tệp gốc
+            return attachment_response(notification.attachment, notification.file_name)
+        if notification.file_name:
+            # Tệp cũ được lưu trực tiếp trong uploads/ theo tên (có thể bị thay thế nên không cache lâu)
+            return send_from_directory(app.config['UPLOAD_FOLDER'], notification.file_name, as_attachment=True)
+    except FileNotFoundError:
+        pass
+    flash('File not found.', 'danger')
+    return redirect(url_for('index'))
     
     
 '''-------------------------------------------------------------'''
 @app.route('/sent_notifications')
 @login_required
 def sent_notifications():
-    # Truy vấn các thông báo đã gửi của người dùng hiện tại
-    sent_notifications = NotificationHistory.query.filter_by(sender_id=current_user.id).all()
-    
-    return render_template('history_notification.html', sent_notifications=sent_notifications)
+    # Tiến độ các công việc đang gửi rồi tới việc lỗi (đúng thứ tự ix_dispatch_job_sender_id, không cần sắp xếp);
+    # việc còn chờ (đến hạn hay hẹn giờ) chỉ đếm
+    dispatch_jobs = DispatchJob.query.options(joinedload(DispatchJob.notification)).filter(
+        DispatchJob.sender_id == current_user.id, DispatchJob.status.in_(('running', 'failed'))
+    ).order_by(DispatchJob.status.desc(), DispatchJob.id.desc()).limit(app.config['SENT_PAGE_SIZE']).all()
+    waiting_jobs, scheduled_jobs = db.session.execute(select(
+        func.count(), func.count().filter(DispatchJob.due_at > datetime.utcnow())
+    ).where(DispatchJob.sender_id == current_user.id, DispatchJob.status == 'pending')).one()
+    # Thông báo đã gửi, phân trang theo cursor và gộp số người nhận/đã đọc
+    entries, next_cursor = sent_page(current_user.id, cursor=request.args.get('cursor'))
+
+    return render_template('history_notification.html', sent_notifications=entries, next_cursor=next_cursor,
+                           dispatch_jobs=dispatch_jobs, waiting_jobs=waiting_jobs - scheduled_jobs,
+                           scheduled_jobs=scheduled_jobs)
+
+@app.route('/sent_notifications/<int:notification_id>/recipients')
+@login_required
+def sent_notification_recipients(notification_id):
+    # Chi tiết người nhận, chỉ tải khi người gửi mở một thông báo; ?seen=0|1 để lọc
+    notification = Notification.query.get_or_404(notification_id)
+    if notification.user_id != current_user.id:
+        abort(404)
+    seen = request.args.get('seen')
+    rows, next_after = sent_recipients(notification_id, after=request.args.get('after', 0, type=int),
+                                       seen=None if seen not in ('0', '1') else seen == '1')
+    return jsonify(recipients=[{'id': row.id, 'username': row.username, 'is_seen': bool(row.is_seen)} for row in rows],
+                   next_after=next_after)
 
 
 '''----------------------------------------------------------------------'''
 @app.route('/mark_as_seen/<int:notification_id>', methods=['POST'])
 @login_required
 def mark_as_seen(notification_id):
-    # Tìm lịch sử thông báo theo ID và kiểm tra nếu người dùng là người nhận
-    notification_history = NotificationHistory.query.filter_by(
-        notification_id=notification_id, recipient_id=current_user.id, is_seen=False).first()
-
-    if notification_history:
-        # Đánh dấu thông báo là đã đọc
-        notification_history.mark_as_seen()
+    # Đánh dấu đã đọc theo trạng thái của chính người dùng (áp dụng cả cho thông báo nhóm)
+    if mark_notifications_seen(current_user.id, [notification_id]):
+        db.session.commit()
         flash('Notification marked as read.', 'success')
     else:
         flash('Notification not found or already read.', 'danger')
 
     return redirect(url_for('index'))
 
+@app.route('/mark_as_seen', methods=['POST'])
+@login_required
+def mark_many_as_seen():
+    # Nhận JSON {"ids": [...]} hoặc {"before": "<cursor>"}; cập nhật trong một transaction.
+    # "Đánh dấu tất cả" gửi cursor của dòng mới nhất đã hiển thị để không đánh dấu thông báo người dùng chưa thấy
+    data = request.get_json(silent=True) or {}
+    if 'ids' in data:
+        if not isinstance(data['ids'], list):
+            return jsonify(error='ids must be a list'), 400
+        changed = mark_notifications_seen(current_user.id, notification_ids=data['ids'])
+    elif 'before' in data:
+        before = decode_cursor(data['before'])
+        if before is None:
+            return jsonify(error='invalid cursor'), 400
+        changed = mark_notifications_seen(current_user.id, before=before)
+    else:
+        return jsonify(error='ids or before is required'), 400
+
+    db.session.commit()
+    unread_count = db.session.scalar(select(User.unread_count).where(User.id == current_user.id))
+    return jsonify(updated=changed, unread_count=unread_count)
+
+@app.route('/stream')
+@login_required
+def stream():
+    # Server-Sent Events: đẩy thông báo mới tới trình duyệt thay vì tải lại trang
+    user_id = current_user.id
+    heartbeat = app.config['SSE_HEARTBEAT_SECONDS']
+    event_bus.start()
+
+    def events():
+        subscription = broker.subscribe(user_id)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield f'event: notification\ndata: {json.dumps(event)}\n\n'
+        finally:
+            # Chạy khi client ngắt kết nối (generator bị đóng)
+            broker.unsubscribe(user_id, subscription)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 '''-----------------------------------------------'''
 @app.route('/delete_notification/<int:notification_id>', methods=['POST'])
 @login_required
@@ -535,8 +2546,21 @@ def delete_notification(notification_id):
         flash("You are not authorized to delete this notification.", "danger")
         return redirect(url_for('index'))
 
-    # Xóa tất cả lịch sử liên quan đến thông báo này
+    # Giảm số tham chiếu của tệp đính kèm; tệp không còn được dùng sẽ được dọn sau
+    if notification.attachment_id:
+        db.session.execute(update(Attachment).where(Attachment.id == notification.attachment_id).values(
+            ref_count=func.max(Attachment.ref_count - 1, 0)))
+
+    # Xóa tất cả lịch sử và công việc gửi liên quan đến thông báo này
     NotificationHistory.query.filter_by(notification_id=notification_id).delete()
+    DispatchJob.query.filter_by(notification_id=notification_id).delete()
+
+    # Giảm bộ đếm chưa đọc của người nhận rồi xóa liên kết người nhận
+    unread_recipients = select(user_notification.c.user_id).where(
+        user_notification.c.notification_id == notification_id, user_notification.c.is_seen == False)
+    db.session.execute(update(User).where(User.id.in_(unread_recipients)).values(
+        unread_count=func.max(User.unread_count - 1, 0)))
+    db.session.execute(delete(user_notification).where(user_notification.c.notification_id == notification_id))
 
     # Xóa thông báo
     db.session.delete(notification)
@@ -548,20 +2572,245 @@ def delete_notification(notification_id):
 @app.route('/search_notifications', methods=['GET'])
 @login_required
 def search_notifications():
-    search_query = request.args.get('search')  # Get the search query from the URL
-    
-    # If a search query is provided, filter notifications based on the content or other fields
-    if search_query:
-        notifications = Notification.query.filter(
-            Notification.content.like(f'%{search_query}%') |
-            Notification.type.like(f'%{search_query}%') |
-            Notification.category.like(f'%{search_query}%')
-        ).all()
+    search_query = request.args.get('search') or ''  # Get the search query from the URL
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    # Chỉ tìm trong các thông báo người dùng đã gửi hoặc đã nhận, có xếp hạng và phân trang
+    archived = request.args.get('archived') == '1'
+    if archived:
+        notifications, has_next = search_archive(current_user.id, search_query, page)
     else:
-        # If no search query is provided, show all notifications
-        notifications = Notification.query.all()
+        notifications, has_next = search_page(current_user.id, search_query, page)
+
+    return render_template('history_notification.html', notifications=notifications, page=page, has_next=has_next,
+                           archived=archived)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Chỉ có khi METRICS_ENABLED; Prometheus dùng METRICS_TOKEN, còn trên trình duyệt cần quyền admin
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    token = app.config['METRICS_TOKEN']
+    authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized and not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+
+    jobs = db.session.execute(select(DispatchJob.status, func.count()).group_by(DispatchJob.status)).all()
+    cache = user_cache.stats()
+    gauges = [
+        ('dispatch_jobs', 'gauge', 'Dispatch jobs by status.', [({'status': status}, count) for status, count in jobs]),
+        ('user_cache_hits_total', 'counter', 'user_loader cache hits.', [({}, cache['hits'])]),
+        ('user_cache_misses_total', 'counter', 'user_loader cache misses.', [({}, cache['misses'])]),
+        ('user_cache_entries', 'gauge', 'Users held in the user_loader cache.', [({}, cache['size'])]),
+        ('sse_connected_users', 'gauge', 'Users with an open event stream.', [({}, len(broker.subscribed_user_ids()))]),
+    ]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+SEED_WORDS = ('lịch', 'trực', 'ca', 'đêm', 'điều', 'dưỡng', 'khoa', 'nội', 'ngoại', 'họp', 'giao', 'ban',
+              'bệnh', 'nhân', 'kết', 'quả', 'xét', 'nghiệm', 'phim', 'chụp', 'thuốc', 'đơn', 'phòng', 'mổ')
+SEED_INITIALS = ('b', 'c', 'd', 'đ', 'g', 'h', 'k', 'l', 'm', 'n', 'ph', 'qu', 's', 't', 'th', 'tr', 'v', 'x')
+SEED_RHYMES = ('a', 'á', 'à', 'ạ', 'an', 'ang', 'anh', 'ao', 'ay', 'âm', 'ân', 'ê', 'ết', 'i', 'ình', 'o', 'ó',
+               'ông', 'ơi', 'u', 'ức', 'ương', 'ưu')
+
+def seed_vocabulary(rng):
+    # Từ vựng giả lập phân bố Zipf: vài từ rất phổ biến, phần lớn hiếm
+    words = list(SEED_WORDS) + [initial + rhyme for initial in SEED_INITIALS for rhyme in SEED_RHYMES]
+    rng.shuffle(words)
+    return words, [1 / rank for rank in range(1, len(words) + 1)]
+
+def insert_rows(table, columns, rows):
+    # executemany thẳng trên DBAPI: nhanh hơn nhiều so với dựng tham số cho từng dòng qua SQLAlchemy
+    preparer = db.engine.dialect.identifier_preparer
+    statement = (f'INSERT INTO {preparer.format_table(table)} ({", ".join(preparer.quote(c) for c in columns)}) '
+                 f'VALUES ({", ".join("?" for _ in columns)})')
+    for batch in chunked(rows, 50_000):
+        db.session.connection().exec_driver_sql(statement, batch)
+
+def seed_database(users, groups, notifications, seed=42, password='password', days=90):
+    """Sinh dữ liệu giả lập bằng insert hàng loạt; id nối tiếp dữ liệu đang có.
+
+    Kích thước nhóm theo phân bố Zipf (vài khoa rất đông), mỗi người thuộc một nhóm chính
+    và có thể thêm một nhóm nữa. 60% thông báo gửi theo nhóm, còn lại gửi tới 1-5 người;
+    khoảng 70% liên kết đã đọc. Mọi người dùng có cùng mật khẩu ``password``.
+    """
+    rng = random.Random(seed)
+    words, weights = seed_vocabulary(rng)
+    first_user = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    first_group = (db.session.scalar(select(func.max(Group.id))) or 0) + 1
+    first_notification = (db.session.scalar(select(func.max(Notification.id))) or 0) + 1
+    user_ids = list(range(first_user, first_user + users))
+    group_ids = list(range(first_group, first_group + groups))
+
+    password_hash = password_hasher.hash(password)
+    insert_rows(User.__table__, ['id', 'username', 'email', 'password_hash', 'is_admin', 'unread_count'],
+                [(user_id, f'user{user_id}', f'user{user_id}@example.com', password_hash, False, 0)
+                 for user_id in user_ids])
+    insert_rows(Group.__table__, ['id', 'name'], [(group_id, f'Nhóm {group_id}') for group_id in group_ids])
+
+    group_weights = [1 / rank for rank in range(1, groups + 1)]
+    members = {group_id: set() for group_id in group_ids}
+    for user_id in user_ids:
+        if not group_ids:
+            break
+        members[rng.choices(group_ids, group_weights)[0]].add(user_id)
+        if rng.random() < 0.3:
+            members[rng.choice(group_ids)].add(user_id)
+    insert_rows(user_group, ['user_id', 'group_id'],
+                [(user_id, group_id) for group_id, ids in members.items() for user_id in ids])
+
+    # Giờ Việt Nam như Notification.date_created; định dạng chuỗi giống kiểu DateTime của SQLAlchemy
+    start = get_vietnam_time().replace(tzinfo=None) - timedelta(days=days)
+    step = timedelta(days=days) / max(notifications, 1)
+    notification_rows, links, history = [], [], []
+    for offset in range(notifications):
+        notification_id = first_notification + offset
+        sender_id = rng.choice(user_ids)
+        sent_at = (start + step * offset).strftime('%Y-%m-%d %H:%M:%S.%f')
+        category = rng.choice(('Khẩn cấp', 'Cá nhân', 'Nhóm'))
+        notification_rows.append((notification_id, ' '.join(rng.choices(words, weights, k=rng.randint(8, 30))),
+                                  ' '.join(rng.choices(words, weights, k=3)), category, sender_id, sent_at))
+        if group_ids and rng.random() < 0.6:
+            group_id = rng.choice(group_ids)
+            recipients = members[group_id]
+            history.append((notification_id, sender_id, None, group_id, sent_at, False))
+            links += [(user_id, notification_id, rng.random() < 0.7, sent_at) for user_id in recipients]
+        else:
+            for user_id in rng.sample(user_ids, min(len(user_ids), rng.randint(1, 5))):
+                seen = rng.random() < 0.7
+                history.append((notification_id, sender_id, user_id, None, sent_at, seen))
+                links.append((user_id, notification_id, seen, sent_at))
+
+    insert_rows(Notification.__table__, ['id', 'content', 'type', 'category', 'user_id', 'date_created'],
+                notification_rows)
+    insert_rows(NotificationHistory.__table__,
+                ['notification_id', 'sender_id', 'recipient_id', 'group_id', 'date_sent', 'is_seen'], history)
+    insert_rows(user_notification, ['user_id', 'notification_id', 'is_seen', 'date_created'], links)
+
+    # Bộ đếm chưa đọc tính lại một lần cho các người dùng mới
+    unread = select(func.count()).select_from(user_notification).where(
+        user_notification.c.user_id == User.id, user_notification.c.is_seen == False).scalar_subquery()
+    db.session.execute(update(User).where(User.id >= first_user).values(unread_count=unread)
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+    return {'users': users, 'groups': groups, 'memberships': sum(len(ids) for ids in members.values()),
+            'notifications': notifications, 'links': len(links), 'history': len(history)}
+
+@app.cli.command('seed')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--groups', default=20, show_default=True)
+@click.option('--notifications', default=10000, show_default=True)
+@click.option('--seed', 'seed_value', default=42, show_default=True, help='Cùng giá trị thì sinh cùng dữ liệu.')
+@click.option('--password', default='password', show_default=True)
+def seed_command(users, groups, notifications, seed_value, password):
+    """Sinh người dùng, nhóm và thông báo giả lập để đo hiệu năng."""
+    started = time.perf_counter()
+    counts = seed_database(users, groups, notifications, seed=seed_value, password=password)
+    click.echo(', '.join(f'{count} {name}' for name, count in counts.items())
+               + f' in {time.perf_counter() - started:.1f}s.')
+
+@app.cli.command('import-legacy-uploads')
+@click.option('--remove-originals', is_flag=True, help='Xóa tệp cũ trong uploads/ sau khi đã chuyển vào kho.')
+def import_legacy_uploads(remove_originals):
+    """Chuyển tệp đính kèm cũ (lưu theo tên trong uploads/) vào kho theo mã băm."""
+    notifications = Notification.query.filter(
+        Notification.attachment_id.is_(None), Notification.file_name.isnot(None)).all()
+    imported, missing, originals = 0, 0, set()
+    for notification in notifications:
+        path = os.path.join(app.root_path, app.config['UPLOAD_FOLDER'], notification.file_name)
+        if not os.path.isfile(path):
+            missing += 1
+            continue
+        with open(path, 'rb') as legacy_file:
+            attachment = store_attachment(legacy_file, mimetypes.guess_type(notification.file_name)[0])
+        link_attachment(notification, attachment, notification.file_name)
+        originals.add(path)
+        imported += 1
+    db.session.commit()
 
-    return render_template('history_notification.html', notifications=notifications)
+    if remove_originals:
+        for path in originals:
+            os.remove(path)
+    click.echo(f'Imported {imported} attachments ({missing} missing files).')
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--report', type=click.Path(dir_okay=False), help='Ghi các dòng lỗi ra tệp CSV.')
+def import_users_command(path, report):
+    """Nhập người dùng và thành viên nhóm từ tệp CSV/XLSX."""
+    started = time.perf_counter()
+    with open(path, 'rb') as source:
+        try:
+            created, errors = import_users(read_import_rows(source, path))
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    if report:
+        with open(report, 'w', newline='', encoding='utf-8') as report_file:
+            write_import_report(errors, report_file)
+    for row_number, username, error in errors[:20]:
+        click.echo(f'row {row_number} ({username}): {error}', err=True)
+    click.echo(f'Imported {created} users, {len(errors)} rows with errors in {time.perf_counter() - started:.1f}s.')
+
+@app.cli.command('export-notifications')
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--kind', type=click.Choice(list(EXPORT_COLUMNS)), default='notifications', show_default=True,
+              help='receipts: mỗi người nhận một dòng kèm trạng thái đã đọc.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv', show_default=True)
+@click.option('--start', help='Từ ngày (YYYY-MM-DD).')
+@click.option('--end', help='Đến hết ngày (YYYY-MM-DD).')
+@click.option('--gzip', 'compress', is_flag=True, help='Nén gzip.')
+def export_notifications_command(path, kind, fmt, start, end, compress):
+    """Xuất thông báo hoặc trạng thái đọc ra CSV/JSON Lines (PATH là - để ghi ra stdout)."""
+    try:
+        start, end = parse_export_range(start, end)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    started, written = time.perf_counter(), 0
+    with click.open_file(path, 'wb') as output:
+        for chunk in export_chunks(export_rows(kind, start, end), EXPORT_COLUMNS[kind], fmt, compress):
+            output.write(chunk)
+            written += len(chunk)
+    click.echo(f'Exported {written} bytes in {time.perf_counter() - started:.1f}s.', err=True)
+
+@app.cli.command('archive')
+@click.option('--days', type=int, help='Mặc định RETENTION_DAYS.')
+@click.option('--batch-size', type=int, help='Mặc định ARCHIVE_BATCH_SIZE.')
+@click.option('--no-vacuum', is_flag=True, help='Không thu hồi dung lượng trống sau khi chuyển.')
+def archive_command(days, batch_size, no_vacuum):
+    """Chuyển thông báo cũ sang cơ sở dữ liệu lưu trữ, xóa tệp không còn dùng và thu gọn tệp chính.
+
+    Chạy định kỳ, ví dụ mỗi đêm bằng cron.
+    """
+    days = days if days is not None else app.config['RETENTION_DAYS']
+    if days is None:
+        raise click.ClickException('RETENTION_DAYS is not set.')
+    if not archive_database_path(db.engine):
+        raise click.ClickException('Archiving needs a file-based SQLite database.')
+    started = time.perf_counter()
+    archived = archive_notifications(get_vietnam_time() - timedelta(days=days), batch_size)
+    files, size = collect_unused_attachments()
+    freed = 0 if no_vacuum else compact_database()
+    click.echo(f'Archived {archived} notifications, removed {files} attachments ({size} bytes), '
+               f'freed {freed} bytes in {time.perf_counter() - started:.1f}s.')
+
+@app.cli.command('dispatch')
+def dispatch_command():
+    """Chạy các công việc gửi đã đến hạn (cho DISPATCH_WORKERS = 0, ví dụ chạy bằng cron mỗi phút)."""
+    processed = 0
+    while dispatcher.run_next():
+        processed += 1
+    click.echo(f'Ran {processed} dispatch jobs.')
+
+@app.cli.command('prune-uploads')
+def prune_uploads():
+    """Xóa các phiên tải lên theo đoạn đã quá UPLOAD_SESSION_TTL mà chưa được dùng."""
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['UPLOAD_SESSION_TTL'])
+    uploads = UploadSession.query.filter(UploadSession.date_updated < cutoff).all()
+    for upload in uploads:
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
+        db.session.delete(upload)
+    db.session.commit()
+    click.echo(f'Removed {len(uploads)} stale uploads.')
 
 if __name__ == '__main__':
     #with app.app_context():
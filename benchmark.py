@@ -0,0 +1,587 @@
+"""Đo hiệu năng các đường xử lý nặng của ứng dụng trên một cơ sở dữ liệu tạm.
+
+Ví dụ:
+    python benchmark.py fanout --recipients 10000 100000
+    python benchmark.py bus --workers 4 --events 200
+    python benchmark.py search --rows 1000000
+    python benchmark.py members --members 50000
+    python benchmark.py login --methods scrypt:32768:8:1 scrypt:16384:8:1 pbkdf2:sha256:600000
+    python benchmark.py routes --output before.json
+    python benchmark.py routes --compare before.json
+    python benchmark.py plans
+    python benchmark.py concurrency --members 200000 --sends 3
+    python benchmark.py schedule --jobs 1000 --backlog 10000
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+
+def setup_app(db_path):
+    # Cấu hình phải được đặt trước khi import app (xem app.config.from_prefixed_env)
+    os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    from app import app, db
+    with app.app_context():
+        db.create_all()
+    return app, db
+
+
+def seed_users(db, count, start=1):
+    from sqlalchemy import insert
+    from app import User
+    rows = [
+        {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': ''}
+        for i in range(start, start + count)
+    ]
+    db.session.execute(insert(User.__table__), rows)
+    db.session.commit()
+    return [row['id'] for row in rows]
+
+
+def bench_fanout(args):
+    from sqlalchemy import insert
+    app, db = setup_app(os.path.join(args.workdir, 'fanout.db'))
+    from app import Group, Notification, user_group, fan_out_notification
+
+    with app.app_context():
+        total = max(args.recipients)
+        user_ids = seed_users(db, total + 1)
+        sender_id = user_ids.pop(0)
+
+        print(f'{"mode":<8}{"recipients":>12}{"seconds":>10}{"rows/s":>14}')
+        for count in args.recipients:
+            members = user_ids[:count]
+            group = Group(name=f'group-{count}')
+            db.session.add(group)
+            db.session.flush()
+            db.session.execute(insert(user_group), [{'user_id': uid, 'group_id': group.id} for uid in members])
+            db.session.commit()
+
+            for mode in ('group', 'user'):
+                notification = Notification(type='bench', content='bench', category='Nhóm', user_id=sender_id)
+                db.session.add(notification)
+                db.session.flush()
+                started = time.perf_counter()
+                if mode == 'group':
+                    linked = fan_out_notification(notification.id, sender_id, group_ids=[group.id])
+                    history = 1
+                else:
+                    linked = fan_out_notification(notification.id, sender_id, user_ids=members)
+                    history = linked
+                db.session.commit()
+                elapsed = time.perf_counter() - started
+                rows = linked + history
+                print(f'{mode:<8}{count:>12}{elapsed:>10.3f}{rows / elapsed:>14,.0f}')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _bus_listener(db_path, user_id, count, ready, results):
+    # Tiến trình worker riêng: chỉ nhận sự kiện qua nhật ký notification_event
+    os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    from app import app, broker, event_bus
+    with app.app_context():
+        subscription = broker.subscribe(user_id)
+        event_bus.start()
+    ready.set()
+    received = {}
+    while len(received) < count:
+        event = subscription.get()
+        received[event['id']] = time.time()
+    results.put(received)
+
+
+def bench_bus(args):
+    db_path = os.path.join(args.workdir, 'bus.db')
+    app, db = setup_app(db_path)
+    from app import Notification, fan_out_notification, publish_notification
+
+    with app.app_context():
+        user_ids = seed_users(db, args.workers + 1)
+    sender_id, listener_ids = user_ids[0], user_ids[1:]
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    workers = []
+    for user_id in listener_ids:
+        ready = context.Event()
+        process = context.Process(target=_bus_listener, args=(db_path, user_id, args.events, ready, results))
+        process.start()
+        workers.append((process, ready))
+    for _, ready in workers:
+        ready.wait()
+
+    sent = {}
+    with app.app_context():
+        for i in range(args.events):
+            notification = Notification(type='bench', content=f'event {i}', category='Nhóm', user_id=sender_id)
+            db.session.add(notification)
+            db.session.flush()
+            fan_out_notification(notification.id, sender_id, user_ids=listener_ids)
+            publish_notification(notification)
+            db.session.commit()
+            sent[notification.id] = time.time()
+            time.sleep(args.interval)
+
+    latencies = []
+    for _ in workers:
+        received = results.get()
+        latencies += [(received[notification_id] - sent_at) * 1000 for notification_id, sent_at in sent.items()]
+    for process, _ in workers:
+        process.join()
+
+    print(f'{args.workers} workers, {args.events} events, poll {app.config["EVENT_BUS_POLL_SECONDS"]}s')
+    print(f'latency ms: p50={statistics.median(latencies):.1f} '
+          f'p95={percentile(latencies, 0.95):.1f} max={max(latencies):.1f}')
+
+
+def bench_search(args):
+    from sqlalchemy import insert
+    app, db = setup_app(os.path.join(args.workdir, 'search.db'))
+    from app import Notification, search_page, seed_vocabulary
+
+    with app.app_context():
+        sender_id = seed_users(db, 1)[0]
+        rng = random.Random(42)
+        words, weights = seed_vocabulary(rng)
+        started = time.perf_counter()
+        for start in range(0, args.rows, 50_000):
+            batch = [
+                {'type': ' '.join(rng.choices(words, weights, k=2)), 'content': ' '.join(rng.choices(words, weights, k=12)),
+                 'category': rng.choice(('Khẩn cấp', 'Cá nhân', 'Nhóm')), 'user_id': sender_id}
+                for _ in range(min(50_000, args.rows - start))
+            ]
+            db.session.execute(insert(Notification.__table__), batch)
+            db.session.commit()
+        print(f'seeded {args.rows:,} notifications in {time.perf_counter() - started:.1f}s')
+
+        print(f'{"backend":<8}{"query":<20}{"p50 ms":>10}{"p95 ms":>10}')
+        for backend in ('fts', 'like'):
+            app.config['SEARCH_BACKEND'] = backend
+            for query in args.queries:
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    search_page(sender_id, query)
+                    timings.append((time.perf_counter() - started) * 1000)
+                print(f'{backend:<8}{query:<20}{statistics.median(timings):>10.1f}{percentile(timings, 0.95):>10.1f}')
+
+
+def bench_members(args):
+    app, db = setup_app(os.path.join(args.workdir, 'members.db'))
+    from app import Group, set_group_members
+
+    with app.app_context():
+        user_ids = seed_users(db, args.members * 2)
+        group = Group(name='bench')
+        db.session.add(group)
+        db.session.commit()
+
+        # Giá trị từ form là chuỗi, giống request thật
+        half = args.members // 2
+        steps = [
+            ('create', user_ids[:args.members]),
+            ('resave', user_ids[:args.members]),
+            ('swap half', user_ids[half:args.members + half]),
+            ('clear', []),
+        ]
+        print(f'{"step":<12}{"added":>10}{"removed":>10}{"seconds":>10}')
+        for name, members in steps:
+            started = time.perf_counter()
+            added, removed = set_group_members(group.id, [str(user_id) for user_id in members])
+            db.session.commit()
+            elapsed = time.perf_counter() - started
+            print(f'{name:<12}{len(added):>10}{len(removed):>10}{elapsed:>10.3f}')
+
+
+def bench_login(args):
+    # Số luồng băm phải được đặt trước khi import app
+    os.environ['FLASK_PASSWORD_HASH_WORKERS'] = str(args.workers)
+    app, db = setup_app(os.path.join(args.workdir, 'login.db'))
+    from sqlalchemy import update
+    from app import User, password_hasher
+
+    with app.app_context():
+        user_ids = seed_users(db, args.users)
+
+    def client_loop(deadline):
+        client = app.test_client()
+        rng = random.Random()
+        timings = []
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = client.post('/login', data={'username': f'user{rng.choice(user_ids)}', 'password': 'secret'})
+            assert response.status_code == 302, response.status_code
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    cores = min(args.workers, os.cpu_count())
+    print(f'{args.clients} clients, {args.workers} hash workers, {os.cpu_count()} CPUs')
+    print(f'{"method":<24}{"logins/s":>10}{"per core":>10}{"p50 ms":>10}{"p95 ms":>10}')
+    for method in args.methods:
+        app.config['PASSWORD_HASH_METHOD'] = method
+        with app.app_context():
+            # Mọi người dùng dùng chung một mã băm để không tốn thời gian chuẩn bị
+            db.session.execute(update(User).values(password_hash=password_hasher.hash('secret')))
+            db.session.commit()
+        deadline = time.perf_counter() + args.seconds
+        with concurrent.futures.ThreadPoolExecutor(args.clients) as pool:
+            timings = sum(pool.map(client_loop, [deadline] * args.clients), [])
+        rate = len(timings) / args.seconds
+        print(f'{method:<24}{rate:>10.1f}{rate / cores:>10.1f}'
+              f'{statistics.median(timings):>10.1f}{percentile(timings, 0.95):>10.1f}')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def route_scenarios(args, db_name):
+    """Dựng cơ sở dữ liệu giả lập, đăng nhập một số người dùng và trả về các kịch bản gọi route.
+
+    Mỗi kịch bản nhận (client, user_id), chuẩn bị dữ liệu cần thiết rồi trả về hàm gửi request.
+    """
+    # Gửi ngay trong request (không qua luồng nền) để thời gian đo gồm cả việc ghi người nhận
+    os.environ['FLASK_DISPATCH_WORKERS'] = '0'
+    app, db = setup_app(os.path.join(args.workdir, db_name))
+    from sqlalchemy import select
+    from app import Group, Notification, User, seed_database, seed_vocabulary, user_notification
+
+    with app.app_context():
+        started = time.perf_counter()
+        counts = seed_database(args.users, args.groups, args.notifications, seed=args.seed)
+        print(', '.join(f'{count} {name}' for name, count in counts.items())
+              + f' seeded in {time.perf_counter() - started:.1f}s')
+        user_ids = db.session.scalars(select(User.id)).all()
+        group_ids = db.session.scalars(select(Group.id)).all()
+
+    rng = random.Random(args.seed)
+    words, weights = seed_vocabulary(random.Random(args.seed))
+    clients = {}
+    for user_id in rng.sample(user_ids, min(args.clients, len(user_ids))):
+        client = app.test_client()
+        client.post('/login', data={'username': f'user{user_id}', 'password': 'password'})
+        clients[user_id] = client
+
+    def unread_notification(user_id):
+        with app.app_context():
+            return db.session.scalar(select(user_notification.c.notification_id).where(
+                user_notification.c.user_id == user_id, user_notification.c.is_seen == False).limit(1))
+
+    def sent_recipients(client, user_id):
+        # Thông báo gần nhất của chính người gửi này (route trả 404 với thông báo của người khác)
+        with app.app_context():
+            notification_id = db.session.scalar(select(Notification.id).where(Notification.user_id == user_id)
+                                                .order_by(Notification.date_created.desc()).limit(1))
+        return lambda: client.get(f'/sent_notifications/{notification_id or 0}/recipients')
+
+    def mark_as_seen(client, user_id):
+        notification_id = unread_notification(user_id)
+        return lambda: client.post(f'/mark_as_seen/{notification_id or 0}')
+
+    scenarios = {
+        'index': lambda client, user_id: lambda: client.get('/'),
+        'index_unread': lambda client, user_id: lambda: client.get('/?unread=1'),
+        'sent_notifications': lambda client, user_id: lambda: client.get('/sent_notifications'),
+        'sent_recipients': sent_recipients,
+        'search_notifications': lambda client, user_id: lambda: client.get(
+            '/search_notifications', query_string={'search': ' '.join(rng.choices(words, weights, k=2))}),
+        'send_notification_to_user': lambda client, user_id: lambda: client.post('/send_notification_to_user', data={
+            'title': 'bench', 'content': 'bench', 'category': 'Cá nhân',
+            'user_ids': [str(uid) for uid in rng.sample(user_ids, 5)]}),
+        'send_notification_to_group': lambda client, user_id: lambda: client.post('/send_notification_to_group', data={
+            'title': 'bench', 'content': 'bench', 'category': 'Nhóm', 'group_ids': [str(rng.choice(group_ids))]}),
+        'mark_as_seen': mark_as_seen,
+    }
+    if args.only:
+        scenarios = {name: prepare for name, prepare in scenarios.items() if name in args.only}
+    return app, db, rng, clients, scenarios
+
+
+def bench_routes(args):
+    from sqlalchemy import event
+    app, db, rng, clients, scenarios = route_scenarios(args, 'routes.db')
+    with app.app_context():
+        engines = list(db.engines.values())  # Engine ghi và engine đọc (chế độ 'wal')
+    queries = [0]
+    for engine in engines:
+        event.listen(engine, 'after_cursor_execute', lambda *_: queries.__setitem__(0, queries[0] + 1))
+
+    results = {}
+    for name, prepare in scenarios.items():
+        timings, query_counts = [], []
+        for _ in range(args.repeat):
+            user_id, client = rng.choice(list(clients.items()))
+            request = prepare(client, user_id)  # Chuẩn bị dữ liệu ngoài phần đo
+            queries[0] = 0
+            started = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started) * 1000)
+            query_counts.append(queries[0])
+            assert response.status_code in (200, 302, 404), (name, response.status_code)
+        results[name] = {'p50_ms': round(statistics.median(timings), 2), 'p95_ms': round(percentile(timings, 0.95), 2),
+                         'queries': round(statistics.mean(query_counts), 1), 'samples': len(timings)}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+    print(f'{"route":<28}{"p50 ms":>10}{"p95 ms":>10}{"queries":>10}' + (f'{"Δp50":>10}{"Δqueries":>10}' if baseline else ''))
+    for name, result in results.items():
+        line = f'{name:<28}{result["p50_ms"]:>10.1f}{result["p95_ms"]:>10.1f}{result["queries"]:>10.1f}'
+        if baseline and name in baseline:
+            before = baseline[name]
+            line += f'{(result["p50_ms"] / before["p50_ms"] - 1) * 100:>+9.0f}%{result["queries"] - before["queries"]:>+10.1f}'
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'revision': git_revision(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'params': {key: getattr(args, key) for key in ('users', 'groups', 'notifications', 'seed',
+                                                                      'clients', 'repeat')},
+                       'results': results}, output, indent=2)
+
+
+def bench_plans(args):
+    """Chạy tests/test_query_plans.py: EXPLAIN QUERY PLAN mọi câu lệnh của các route chính, lỗi nếu có full scan."""
+    import pytest
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'test_query_plans.py')
+    targets = [f'{path}::test_route_queries_use_indexes[{name}]' for name in args.only] if args.only else [path]
+    raise SystemExit(pytest.main(['-q', *targets]))
+
+
+def _concurrency_run(mode, db_path, args, results):
+    # Tiến trình riêng cho mỗi chế độ: DATABASE_MODE được đọc khi import app
+    import threading
+    from sqlalchemy import insert
+    os.environ['FLASK_DATABASE_MODE'] = mode
+    os.environ['FLASK_DISPATCH_WORKERS'] = '0'
+    app, db = setup_app(db_path)
+    from app import Group, Notification, user_group, fan_out_notification
+
+    with app.app_context():
+        user_ids = seed_users(db, args.members + 1)
+        sender_id, members = user_ids[0], user_ids[1:]
+        group = Group(name='everyone')
+        db.session.add(group)
+        db.session.flush()
+        db.session.execute(insert(user_group), [{'user_id': uid, 'group_id': group.id} for uid in members])
+        db.session.commit()
+        group_id = group.id
+        # Vài thông báo có sẵn để trang hộp thư có dữ liệu
+        for i in range(5):
+            notification = Notification(type='bench', content=f'warm {i}', category='Nhóm', user_id=sender_id)
+            db.session.add(notification)
+            db.session.flush()
+            fan_out_notification(notification.id, sender_id, group_ids=[group_id])
+        db.session.commit()
+
+    sending = threading.Event()
+    done = threading.Event()
+    send_seconds = []
+
+    def sender():
+        with app.app_context():
+            for i in range(args.sends):
+                started = time.perf_counter()
+                notification = Notification(type='bench', content=f'send {i}', category='Nhóm', user_id=sender_id)
+                db.session.add(notification)
+                db.session.flush()
+                sending.set()
+                fan_out_notification(notification.id, sender_id, group_ids=[group_id])
+                db.session.commit()
+                send_seconds.append(time.perf_counter() - started)
+        done.set()
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        sending.wait()
+        while not done.is_set():
+            user_id = rng.choice(members)
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+            started = time.perf_counter()
+            response = client.get('/')
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                (latencies if response.status_code == 200 else errors).append(elapsed)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    threads.append(threading.Thread(target=sender))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put({'mode': mode, 'send_s': statistics.mean(send_seconds), 'reads': len(latencies), 'errors': len(errors),
+                 'p50': statistics.median(latencies) if latencies else 0,
+                 'p95': percentile(latencies, 0.95) if latencies else 0,
+                 'max': max(latencies + errors, default=0)})
+
+
+def bench_concurrency(args):
+    """Đọc hộp thư từ nhiều luồng trong lúc gửi một thông báo nhóm rất lớn, so sánh chế độ 'default' và 'wal'."""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    print(f'{args.members} members, {args.sends} sends, {args.readers} readers')
+    print(f'{"mode":<10}{"send s":>10}{"reads":>8}{"errors":>8}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}')
+    for mode in args.modes:
+        process = context.Process(target=_concurrency_run,
+                                  args=(mode, os.path.join(args.workdir, f'concurrency-{mode}.db'), args, results))
+        process.start()
+        result = results.get()
+        process.join()
+        print(f'{result["mode"]:<10}{result["send_s"]:>10.2f}{result["reads"]:>8}{result["errors"]:>8}'
+              f'{result["p50"]:>10.1f}{result["p95"]:>10.1f}{result["max"]:>10.1f}')
+
+
+def bench_schedule(args):
+    """Độ trễ so với giờ hẹn khi có nhiều công việc hẹn giờ, và kiểm tra không gửi trùng."""
+    from datetime import datetime, timedelta
+    from sqlalchemy import func, select, update
+    os.environ['FLASK_DISPATCH_WORKERS'] = '0'  # Tự khởi động dispatcher bên dưới, sau khi đã tạo xong công việc
+    app, db = setup_app(os.path.join(args.workdir, 'schedule.db'))
+    from app import DispatchJob, Notification, NotificationEvent, User, dispatcher, enqueue_dispatch, user_notification
+
+    with app.app_context():
+        user_ids = seed_users(db, args.recipients + 1)
+        sender_id, recipients = user_ids[0], user_ids[1:]
+        far = datetime.utcnow() + timedelta(days=7)
+        # Công việc ở rất xa trong tương lai: không được làm chậm việc tìm hạn gần nhất
+        for i in range(args.backlog):
+            notification = Notification(type='bench', content=f'later {i}', category='Nhóm', user_id=sender_id)
+            db.session.add(notification)
+            enqueue_dispatch(notification, sender_id, user_ids=recipients, due_at=far + timedelta(seconds=i))
+        jobs = []
+        for i in range(args.jobs):
+            notification = Notification(type='bench', content=f'shift {i}', category='Nhóm', user_id=sender_id)
+            db.session.add(notification)
+            jobs.append(enqueue_dispatch(notification, sender_id, user_ids=recipients, due_at=far))
+        db.session.flush()
+        # Đặt giờ hẹn sau khi đã tạo xong để thời gian chuẩn bị không tính vào độ trễ
+        start = datetime.utcnow() + timedelta(seconds=1)
+        due = {job.id: start + timedelta(seconds=args.spread * i / max(args.jobs, 1)) for i, job in enumerate(jobs)}
+        db.session.execute(update(DispatchJob), [{'id': job_id, 'due_at': due_at} for job_id, due_at in due.items()])
+        db.session.commit()
+
+    dispatcher.workers = args.workers
+    dispatcher.start()
+    dispatcher.wake()
+    deadline = time.time() + args.spread + 60
+    with app.app_context():
+        done = select(func.count()).select_from(DispatchJob).where(DispatchJob.status == 'done')
+        while db.session.scalar(done) < len(due) and time.time() < deadline:
+            db.session.rollback()
+            time.sleep(0.2)
+        # Thời điểm gửi thật là lúc sự kiện của thông báo được ghi (cùng transaction với đoạn cuối)
+        sent = select(DispatchJob.id, NotificationEvent.date_created).join(
+            NotificationEvent, NotificationEvent.notification_id == DispatchJob.notification_id
+        ).where(DispatchJob.status == 'done')
+        lateness = {job_id: (sent_at - due[job_id]).total_seconds() * 1000
+                    for job_id, sent_at in db.session.execute(sent) if job_id in due}
+        links = db.session.scalar(select(func.count()).select_from(user_notification))
+        unread = db.session.scalar(select(func.sum(User.unread_count)))
+        early = db.session.scalar(select(func.count()).select_from(DispatchJob).where(DispatchJob.status != 'pending',
+                                                                                     DispatchJob.due_at > datetime.utcnow()))
+
+    values = list(lateness.values())
+    print(f'{args.jobs} jobs over {args.spread}s, {args.backlog} future jobs, {args.recipients} recipients each, '
+          f'{args.workers} workers')
+    print(f'done {len(values)}/{len(due)}; lateness ms: p50={statistics.median(values):.0f} '
+          f'p95={percentile(values, 0.95):.0f} max={max(values):.0f}')
+    expected = len(due) * args.recipients
+    print(f'links {links} (expected {expected}), unread {unread}, started early {early}')
+    if links != expected or unread != expected or early:
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workdir', default=None, help='Thư mục chứa cơ sở dữ liệu tạm')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fanout = commands.add_parser('fanout', help='Tốc độ ghi khi gửi thông báo hàng loạt')
+    fanout.add_argument('--recipients', type=int, nargs='+', default=[10_000, 100_000])
+    fanout.set_defaults(func=bench_fanout)
+
+    bus = commands.add_parser('bus', help='Độ trễ đẩy sự kiện giữa nhiều tiến trình worker')
+    bus.add_argument('--workers', type=int, default=4)
+    bus.add_argument('--events', type=int, default=200)
+    bus.add_argument('--interval', type=float, default=0.01, help='Giây giữa hai lần gửi')
+    bus.set_defaults(func=bench_bus)
+
+    search = commands.add_parser('search', help='So sánh tìm kiếm FTS5 với LIKE')
+    search.add_argument('--rows', type=int, default=1_000_000)
+    search.add_argument('--queries', nargs='+', default=['điều dưỡng', 'xet nghiem', 'phòng mổ'])
+    search.add_argument('--repeat', type=int, default=5)
+    search.set_defaults(func=bench_search)
+
+    members = commands.add_parser('members', help='Cập nhật thành viên nhóm lớn')
+    members.add_argument('--members', type=int, default=50_000)
+    members.set_defaults(func=bench_members)
+
+    login = commands.add_parser('login', help='Số lần đăng nhập mỗi giây theo phương thức băm mật khẩu')
+    login.add_argument('--methods', nargs='+', default=['scrypt:32768:8:1', 'scrypt:16384:8:1', 'pbkdf2:sha256:600000'])
+    login.add_argument('--users', type=int, default=1000)
+    login.add_argument('--clients', type=int, default=16, help='Số request đăng nhập đồng thời')
+    login.add_argument('--workers', type=int, default=os.cpu_count(), help='PASSWORD_HASH_WORKERS')
+    login.add_argument('--seconds', type=float, default=5)
+    login.set_defaults(func=bench_login)
+
+    routes = commands.add_parser('routes', help='Độ trễ và số câu lệnh SQL của các route chính (qua test client)')
+    routes.add_argument('--users', type=int, default=2000)
+    routes.add_argument('--groups', type=int, default=30)
+    routes.add_argument('--notifications', type=int, default=20_000)
+    routes.add_argument('--seed', type=int, default=42)
+    routes.add_argument('--clients', type=int, default=20, help='Số người dùng đăng nhập để gửi request')
+    routes.add_argument('--repeat', type=int, default=50, help='Số lần gọi mỗi route')
+    routes.add_argument('--only', nargs='+', help='Chỉ chạy các route này')
+    routes.add_argument('--output', help='Ghi kết quả JSON để so sánh giữa các commit')
+    routes.add_argument('--compare', help='Tệp JSON kết quả trước đó để so sánh')
+    routes.set_defaults(func=bench_routes)
+
+    plans = commands.add_parser('plans', help='Chạy tests/test_query_plans.py (EXPLAIN QUERY PLAN của các route chính)')
+    plans.add_argument('--only', nargs='+', help='Chỉ kiểm tra các route này')
+    plans.set_defaults(func=bench_plans)
+
+    concurrency = commands.add_parser('concurrency', help='Độ trễ đọc trong lúc gửi thông báo lớn theo DATABASE_MODE')
+    concurrency.add_argument('--members', type=int, default=200_000, help='Số thành viên nhóm nhận thông báo')
+    concurrency.add_argument('--sends', type=int, default=3)
+    concurrency.add_argument('--readers', type=int, default=4, help='Số luồng đọc hộp thư')
+    concurrency.add_argument('--modes', nargs='+', default=['default', 'wal'])
+    concurrency.set_defaults(func=bench_concurrency)
+
+    schedule = commands.add_parser('schedule', help='Độ trễ gửi theo giờ hẹn với nhiều công việc hẹn giờ')
+    schedule.add_argument('--jobs', type=int, default=1000, help='Số thông báo đến hạn trong lúc đo')
+    schedule.add_argument('--spread', type=float, default=20, help='Các giờ hẹn rải đều trong bấy nhiêu giây')
+    schedule.add_argument('--backlog', type=int, default=10_000, help='Số thông báo hẹn sau một tuần')
+    schedule.add_argument('--recipients', type=int, default=20)
+    schedule.add_argument('--workers', type=int, default=2)
+    schedule.set_defaults(func=bench_schedule)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        args.workdir = args.workdir or tmp
+        args.func(args)
+
+
+if __name__ == '__main__':
+    main()
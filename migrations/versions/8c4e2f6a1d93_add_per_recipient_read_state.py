@@ -0,0 +1,50 @@
+"""Add per-recipient read state and unread counter
+
+Revision ID: 8c4e2f6a1d93
+Revises: 3b1d7c2e9a41
+Create Date: 2026-10-17 10:03:27.540816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e2f6a1d93'
+down_revision = '3b1d7c2e9a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_notification', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_seen', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.create_index('ix_user_notification_unread', ['user_id', 'notification_id'], unique=False,
+                              sqlite_where=sa.text('is_seen = 0'))
+        batch_op.create_index('ix_user_notification_notification_id', ['notification_id'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Chuyển trạng thái đã đọc của các lần gửi trực tiếp sang bảng user_notification
+    op.execute(
+        'UPDATE user_notification SET is_seen = 1 WHERE EXISTS ('
+        ' SELECT 1 FROM notification_history h'
+        ' WHERE h.notification_id = user_notification.notification_id'
+        ' AND h.recipient_id = user_notification.user_id AND h.is_seen = 1)'
+    )
+    op.execute(
+        'UPDATE user SET unread_count = ('
+        ' SELECT COUNT(*) FROM user_notification un'
+        ' WHERE un.user_id = user.id AND un.is_seen = 0)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('unread_count')
+
+    with op.batch_alter_table('user_notification', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_notification_notification_id')
+        batch_op.drop_index('ix_user_notification_unread')
+        batch_op.drop_column('is_seen')
@@ -0,0 +1,63 @@
+"""Add FTS5 full-text index for notification search
+
+Revision ID: a4f83c1d6e27
+Revises: 5e0b9a3c7f62
+Create Date: 2026-10-17 14:58:13.204417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f83c1d6e27'
+down_revision = '5e0b9a3c7f62'
+branch_labels = None
+depends_on = None
+
+
+def fold(expression):
+    # unicode61 không bỏ dấu chữ đ/Đ nên đổi trước khi đánh chỉ mục
+    return f"replace(replace({expression}, 'đ', 'd'), 'Đ', 'D')"
+
+
+def fts_values(row):
+    columns = [f'{row}.content', f'{row}.type', f"coalesce({row}.category, '')"]
+    return ', '.join(fold(column) for column in columns)
+
+
+def upgrade():
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS notification_fts USING fts5("
+        "content, type, category, content='', tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS notification_fts_insert AFTER INSERT ON notification BEGIN "
+        f"INSERT INTO notification_fts(rowid, content, type, category) VALUES (new.id, {fts_values('new')}); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS notification_fts_delete AFTER DELETE ON notification BEGIN "
+        "INSERT INTO notification_fts(notification_fts, rowid, content, type, category) "
+        f"VALUES ('delete', old.id, {fts_values('old')}); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS notification_fts_update AFTER UPDATE OF content, type, category ON notification BEGIN "
+        "INSERT INTO notification_fts(notification_fts, rowid, content, type, category) "
+        f"VALUES ('delete', old.id, {fts_values('old')}); "
+        f"INSERT INTO notification_fts(rowid, content, type, category) VALUES (new.id, {fts_values('new')}); "
+        "END"
+    )
+    # Đánh chỉ mục các thông báo đã có
+    op.execute(
+        "INSERT INTO notification_fts(rowid, content, type, category) "
+        f"SELECT notification.id, {fts_values('notification')} FROM notification"
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS notification_fts_update')
+    op.execute('DROP TRIGGER IF EXISTS notification_fts_delete')
+    op.execute('DROP TRIGGER IF EXISTS notification_fts_insert')
+    op.execute('DROP TABLE IF EXISTS notification_fts')
@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Cấu hình được đọc khi import app: trỏ tới cơ sở dữ liệu tạm trước khi import
+DATA_DIR = tempfile.mkdtemp(prefix='notifications-test-')
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(DATA_DIR, "test.db")}'
+os.environ['FLASK_DISPATCH_WORKERS'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert, text  # noqa: E402
+
+from app import app as flask_app, db, Group, Notification, User, user_group, fan_out_notification  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    # Không giữ app context trong lúc test: request của test client sẽ dùng chung g
+    # (và người dùng đăng nhập) nếu có sẵn một context đang mở
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        # Bảng FTS nằm ngoài metadata nên phải xóa riêng
+        db.drop_all()
+        db.session.execute(text('DROP TABLE IF EXISTS main.notification_fts'))
+        db.session.commit()
+        db.create_all()
+    return flask_app
+
+
+@pytest.fixture
+def users(app):
+    """alice, bob, carol (mật khẩu 'pw'); bob và carol thuộc nhóm g1."""
+    with app.app_context():
+        created = {}
+        for name in ('alice', 'bob', 'carol'):
+            user = User(username=name, email=f'{name}@example.com')
+            user.set_password('pw')
+            db.session.add(user)
+            created[name] = user
+        group = Group(name='g1')
+        db.session.add(group)
+        db.session.flush()
+        db.session.execute(insert(user_group), [{'user_id': created[name].id, 'group_id': group.id}
+                                                for name in ('bob', 'carol')])
+        db.session.commit()
+        return {name: user.id for name, user in created.items()}
+
+
+def login(username):
+    client = flask_app.test_client()
+    response = client.post('/login', data={'username': username, 'password': 'pw'})
+    assert response.status_code == 302
+    return client
+
+
+def send(sender_id, user_ids=(), group_ids=(), content='hello'):
+    with flask_app.app_context():
+        notification = Notification(type='test', content=content, category='Cá nhân', user_id=sender_id)
+        db.session.add(notification)
+        db.session.flush()
+        fan_out_notification(notification.id, sender_id, user_ids=user_ids, group_ids=group_ids)
+        db.session.commit()
+        return notification.id
+
+
+class QueryCounter:
+    """Đếm câu lệnh SQL trên mọi engine (đọc và ghi) trong khối with."""
+
+    def __init__(self):
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        with flask_app.app_context():
+            self.engines = list(db.engines.values())
+        for engine in self.engines:
+            event.listen(engine, 'after_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in self.engines:
+            event.remove(engine, 'after_cursor_execute', self._count)
@@ -0,0 +1,37 @@
+import io
+import os
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from app import (db, archive_notification, Attachment, Notification, blob_path, collect_unused_attachments,
+                 get_vietnam_time, link_attachment, store_attachment)
+from conftest import send
+
+
+def test_archive_keeps_attachment_reference(app, users, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ATTACHMENT_FOLDER', str(tmp_path))
+    with app.app_context():
+        notification = Notification(type='cũ', content='old with file', category='Cá nhân', user_id=users['alice'],
+                                    date_created=get_vietnam_time().replace(tzinfo=None) - timedelta(days=1))
+        db.session.add(notification)
+        db.session.flush()
+        attachment = store_attachment(io.BytesIO(b'report'), 'text/plain')
+        link_attachment(notification, attachment, 'report.txt')
+        db.session.commit()
+        notification_id, attachment_id, sha256 = notification.id, attachment.id, attachment.sha256
+    send(users['alice'], user_ids=[users['bob']], content='recent')
+
+    # --days 0 là hợp lệ: lưu trữ mọi thông báo tạo trước thời điểm chạy
+    result = app.test_cli_runner().invoke(args=['archive', '--days', '0', '--no-vacuum'])
+    assert result.exit_code == 0, result.output
+    assert 'Archived 2 notifications' in result.output
+
+    with app.app_context():
+        assert db.session.get(Notification, notification_id) is None
+        assert db.session.scalar(select(archive_notification.c.attachment_id).where(
+            archive_notification.c.id == notification_id)) == attachment_id
+        # Bản lưu trữ vẫn tham chiếu tệp nên dọn tệp không dùng không được xóa nó
+        collect_unused_attachments(grace=0)
+        assert db.session.get(Attachment, attachment_id).ref_count == 1
+        assert os.path.exists(blob_path(sha256))
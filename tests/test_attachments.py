@@ -0,0 +1,79 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+from sqlalchemy import select
+
+import app as app_module
+from app import db, Attachment, blob_path, collect_unused_attachments, store_attachment
+
+CONTENT = b'same report'
+
+
+@pytest.fixture
+def unused_blob(app, tmp_path, monkeypatch):
+    """Tệp trong kho có ref_count = 0, đủ điều kiện bị dọn."""
+    monkeypatch.setitem(app.config, 'ATTACHMENT_FOLDER', str(tmp_path))
+    with app.app_context():
+        attachment = store_attachment(io.BytesIO(CONTENT), 'text/plain')
+        db.session.commit()
+        return attachment.sha256
+
+
+def run_gc(app, results):
+    with app.app_context():
+        results.append(collect_unused_attachments(grace=0))
+
+
+def reuse(app):
+    # Tải lên lại cùng nội dung và gắn vào một thông báo (ref_count + 1) trong cùng transaction
+    with app.app_context():
+        attachment = store_attachment(io.BytesIO(CONTENT), 'text/plain')
+        attachment.ref_count += 1
+        db.session.commit()
+        return attachment.id
+
+
+def test_reuse_restores_blob_collected_during_upload(app, unused_blob, monkeypatch):
+    register_blob = app_module.register_blob
+    results = []
+
+    def collect_first(*args, **kwargs):
+        # Việc dọn chạy trọn vẹn giữa lúc tệp tạm đã băm xong và lúc dòng attachment được ghi
+        gc = threading.Thread(target=run_gc, args=(app, results))
+        gc.start()
+        gc.join()
+        return register_blob(*args, **kwargs)
+
+    monkeypatch.setattr(app_module, 'register_blob', collect_first)
+    attachment_id = reuse(app)
+
+    assert results == [(1, len(CONTENT))]
+    with app.app_context():
+        assert db.session.get(Attachment, attachment_id).ref_count == 1
+    with open(blob_path(unused_blob), 'rb') as blob:
+        assert blob.read() == CONTENT
+
+
+def test_collection_waits_for_reuse_to_commit(app, unused_blob, monkeypatch):
+    register_blob = app_module.register_blob
+    results, threads = [], []
+
+    def collect_after(*args, **kwargs):
+        # Dòng đã được ghi (giữ khóa ghi); việc dọn bắt đầu trước khi lần dùng lại commit
+        attachment = register_blob(*args, **kwargs)
+        threads.append(threading.Thread(target=run_gc, args=(app, results)))
+        threads[0].start()
+        time.sleep(0.2)
+        return attachment
+
+    monkeypatch.setattr(app_module, 'register_blob', collect_after)
+    attachment_id = reuse(app)
+    threads[0].join(30)
+
+    assert results == [(0, 0)]
+    with app.app_context():
+        assert db.session.scalar(select(Attachment.ref_count).where(Attachment.id == attachment_id)) == 1
+    assert os.path.exists(blob_path(unused_blob))
@@ -0,0 +1,58 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import login
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Một worker độc lập: đăng ký broker cục bộ cho một người dùng, chạy event bus rồi in
+# nội dung từng sự kiện nhận được (kể cả sự kiện thừa sau số lượng mong đợi). Cấu hình cơ sở dữ liệu kế thừa từ biến môi trường.
+LISTENER = '''
+import json, queue, sys
+sys.path.insert(0, sys.argv[1])
+from app import app, broker, event_bus
+subscription = broker.subscribe(int(sys.argv[2]))
+with app.app_context():
+    event_bus.start()
+print('ready', flush=True)
+for _ in range(int(sys.argv[3])):
+    print(json.dumps(subscription.get(timeout=30)['content']), flush=True)
+try:
+    # Sự kiện thừa (gửi cho người khác) cũng được in ra để test phát hiện
+    print(json.dumps(subscription.get(timeout=1)['content']), flush=True)
+except queue.Empty:
+    pass
+'''
+
+
+def start_listener(user_id, expected):
+    process = subprocess.Popen([sys.executable, '-W', 'ignore', '-c', LISTENER, ROOT, str(user_id), str(expected)],
+                               stdout=subprocess.PIPE, text=True, cwd=ROOT)
+    assert process.stdout.readline().strip() == 'ready'
+    return process
+
+
+def test_events_reach_listeners_in_other_processes(users):
+    listeners = {'bob': start_listener(users['bob'], 10), 'carol': start_listener(users['carol'], 5)}
+    try:
+        alice = login('alice')
+        for i in range(5):
+            assert alice.post('/send_notification_to_user', data={
+                'title': 'riêng', 'content': f'direct {i}', 'category': 'Cá nhân',
+                'user_ids': [str(users['bob'])]}).status_code == 302
+            assert alice.post('/send_notification_to_group', data={
+                'title': 'nhóm', 'content': f'group {i}', 'category': 'Nhóm', 'group_ids': ['1']}).status_code == 302
+
+        received = {}
+        for name, process in listeners.items():
+            output, _ = process.communicate(timeout=60)
+            assert process.returncode == 0
+            received[name] = [json.loads(line) for line in output.splitlines()]
+    finally:
+        for process in listeners.values():
+            process.kill()
+
+    assert sorted(received['bob']) == sorted([f'direct {i}' for i in range(5)] + [f'group {i}' for i in range(5)])
+    assert sorted(received['carol']) == [f'group {i}' for i in range(5)]
@@ -0,0 +1,29 @@
+from conftest import QueryCounter, login, send
+
+
+def inbox_queries(client):
+    with QueryCounter() as counter:
+        response = client.get('/')
+    assert response.status_code == 200
+    return counter.count, response.get_data(as_text=True)
+
+
+def test_inbox_query_count_does_not_grow_with_inbox(users):
+    client = login('bob')
+    client.get('/')  # Nạp cache danh tính trước khi đo
+    for i in range(3):
+        send(users['alice'], user_ids=[users['bob']], content=f'small inbox {i}')
+
+    small, body = inbox_queries(client)
+    assert 'small inbox 2' in body
+
+    # Vượt quá một trang, cả gửi trực tiếp lẫn qua nhóm
+    for i in range(40):
+        if i % 2:
+            send(users['alice'], user_ids=[users['bob']], content=f'large inbox {i}')
+        else:
+            send(users['carol'], group_ids=[1], content=f'large inbox {i}')
+    large, body = inbox_queries(client)
+    assert 'large inbox 39' in body and 'alice' in body and 'carol' in body
+
+    assert large == small
@@ -0,0 +1,25 @@
+import re
+
+from conftest import login, send
+
+
+def test_mark_all_stops_at_newest_rendered_row(users):
+    bob = login('bob')
+    for i in range(3):
+        send(users['alice'], user_ids=[users['bob']], content=f'shown {i}')
+    body = bob.get('/').get_data(as_text=True)
+    before = re.search(r'id="markAllSeen" data-before="([^"]+)"', body).group(1)
+
+    # Đến sau khi trang đã hiển thị (ví dụ qua SSE): người dùng chưa thấy
+    send(users['alice'], user_ids=[users['bob']], content='arrived later')
+
+    response = bob.post('/mark_as_seen', json={'before': before})
+    assert response.status_code == 200
+    assert response.get_json() == {'updated': 3, 'unread_count': 1}
+    body = bob.get('/?unread=1').get_data(as_text=True)
+    assert 'arrived later' in body and 'shown 2' not in body
+
+
+def test_mark_all_requires_cursor(users):
+    bob = login('bob')
+    assert bob.post('/mark_as_seen', json={'all': True}).status_code == 400
@@ -0,0 +1,85 @@
+import re
+
+import pytest
+from sqlalchemy import event, select
+
+from app import db, inbox_page, seed_database, Group, Notification, User, user_notification
+from conftest import login
+
+# "SCAN <bảng>" không kèm USING INDEX là duyệt toàn bộ bảng; bảng ảo (json_each, FTS5) không tính
+FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(?!.*\b(?:USING|VIRTUAL TABLE)\b)(\S+)')
+# Route phân trang theo cursor phải đọc đúng thứ tự của chỉ mục, không sắp xếp lại cả tập kết quả
+TEMP_SORT = re.compile(r'^USE TEMP B-TREE FOR (?:(?:RIGHT PART OF|LAST \d+ TERMS OF) )?ORDER BY')
+KEYSET_ROUTES = {'index', 'index_unread', 'index_next_page', 'sent_notifications'}
+
+
+@pytest.fixture
+def seeded(app):
+    """Dữ liệu giả lập nhỏ; trả về (client, user_id, ids) của một người vừa gửi vừa nhận nhiều thông báo."""
+    with app.app_context():
+        seed_database(200, 10, 1000, seed=42)
+        user_id = db.session.scalar(
+            select(user_notification.c.user_id).join(Notification, Notification.user_id == user_notification.c.user_id)
+            .group_by(user_notification.c.user_id).order_by(db.func.count().desc()).limit(1))
+        username = db.session.scalar(select(User.username).where(User.id == user_id))
+        ids = {
+            'sent': db.session.scalar(select(Notification.id).where(Notification.user_id == user_id)
+                                      .order_by(Notification.date_created.desc()).limit(1)),
+            'unread': db.session.scalar(select(user_notification.c.notification_id).where(
+                user_notification.c.user_id == user_id, user_notification.c.is_seen == False).limit(1)),
+            'cursor': inbox_page(user_id, page_size=5)[1],
+            'group': db.session.scalar(select(Group.id).limit(1)),
+            'users': db.session.scalars(select(User.id).where(User.id != user_id).limit(5)).all(),
+        }
+    client = app.test_client()
+    assert client.post('/login', data={'username': username, 'password': 'password'}).status_code == 302
+    return client, ids
+
+
+ROUTES = {
+    'index': lambda client, ids: client.get('/'),
+    'index_unread': lambda client, ids: client.get('/?unread=1'),
+    'index_next_page': lambda client, ids: client.get('/', query_string={'cursor': ids['cursor']}),
+    'sent_notifications': lambda client, ids: client.get('/sent_notifications'),
+    'sent_recipients': lambda client, ids: client.get(f'/sent_notifications/{ids["sent"]}/recipients'),
+    'search_notifications': lambda client, ids: client.get('/search_notifications', query_string={'search': 'thông báo'}),
+    'send_notification_to_user': lambda client, ids: client.post('/send_notification_to_user', data={
+        'title': 'plan', 'content': 'plan', 'category': 'Cá nhân', 'user_ids': [str(uid) for uid in ids['users']]}),
+    'send_notification_to_group': lambda client, ids: client.post('/send_notification_to_group', data={
+        'title': 'plan', 'content': 'plan', 'category': 'Nhóm', 'group_ids': [str(ids['group'])]}),
+    'mark_as_seen': lambda client, ids: client.post(f'/mark_as_seen/{ids["unread"]}'),
+}
+
+
+@pytest.mark.parametrize('route', ROUTES)
+def test_route_queries_use_indexes(app, seeded, route):
+    client, ids = seeded
+    with app.app_context():
+        engine, engines = db.engine, list(db.engines.values())
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters[0] if executemany else parameters))
+
+    for bound in engines:
+        event.listen(bound, 'before_cursor_execute', capture)
+    try:
+        response = ROUTES[route](client, ids)
+    finally:
+        for bound in engines:
+            event.remove(bound, 'before_cursor_execute', capture)
+    assert response.status_code in (200, 302)
+
+    problems = []
+    with engine.connect() as conn:
+        for statement, parameters in dict(captured).items():
+            if not statement.lstrip().upper().startswith(('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')):
+                continue
+            plan = [row[3] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            scans = [f'SCAN {match.group(1)}' for match in map(FULL_SCAN.match, plan) if match]
+            if route in KEYSET_ROUTES and any(map(TEMP_SORT.match, plan)):
+                scans.append('USE TEMP B-TREE FOR ORDER BY')
+            if scans:
+                problems.append(f'{", ".join(scans)}: {" ".join(statement.split())[:160]}\n    ' + '\n    '.join(plan))
+    assert not problems, '\n'.join(problems)
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from app import broker
+from conftest import login
+
+
+def read_event(chunks):
+    # Bỏ qua heartbeat và dòng retry, trả về sự kiện kế tiếp (hoặc None nếu chỉ có heartbeat)
+    for chunk in chunks:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith('event: notification'):
+            return json.loads(chunk.split('data: ', 1)[1])
+        if chunk.startswith(': heartbeat'):
+            return None
+
+
+@pytest.fixture
+def quick_heartbeat(app):
+    heartbeat = app.config['SSE_HEARTBEAT_SECONDS']
+    app.config['SSE_HEARTBEAT_SECONDS'] = 1
+    yield
+    app.config['SSE_HEARTBEAT_SECONDS'] = heartbeat
+
+
+def test_stream_delivers_only_to_recipient(users, quick_heartbeat):
+    alice, bob, carol = login('alice'), login('bob'), login('carol')
+    streams = {name: client.get('/stream', buffered=False) for name, client in (('bob', bob), ('carol', carol))}
+    chunks = {}
+    for name, response in streams.items():
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        chunks[name] = iter(response.response)
+        assert next(chunks[name]).startswith(b'retry:')  # Đã đăng ký với broker
+    assert set(broker.subscribed_user_ids()) == {users['bob'], users['carol']}
+
+    response = alice.post('/send_notification_to_user', data={
+        'title': 'Họp', 'content': 'chỉ gửi bob', 'category': 'Cá nhân', 'user_ids': [str(users['bob'])]})
+    assert response.status_code == 302
+
+    event = read_event(chunks['bob'])
+    assert event is not None
+    assert event['content'] == 'chỉ gửi bob' and event['sender'] == 'alice'
+    # carol chỉ nhận heartbeat
+    assert read_event(chunks['carol']) is None
+
+    for response in streams.values():
+        response.close()
+    assert broker.subscribed_user_ids() == []
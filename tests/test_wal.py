@@ -0,0 +1,54 @@
+import threading
+import time
+
+from sqlalchemy import insert, text
+
+from app import db, Notification, User, user_group, fan_out_notification
+from conftest import login
+
+
+def test_inbox_reads_during_large_send(app, users):
+    with app.app_context():
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        # Nhóm g1 lớn để lần gửi giữ khóa ghi với nhiều trang chưa commit
+        result = db.session.execute(insert(User.__table__).returning(User.id), [
+            {'username': f'member{i}', 'email': f'member{i}@example.com', 'password_hash': 'x'} for i in range(5000)])
+        db.session.execute(insert(user_group), [{'user_id': user_id, 'group_id': 1} for user_id in result.scalars()])
+        db.session.commit()
+
+    written, release, errors = threading.Event(), threading.Event(), []
+
+    def large_send():
+        try:
+            with app.app_context():
+                # Bộ đệm nhỏ như một lần gửi vượt quá cache: trang bẩn phải ghi ra tệp trước khi commit
+                db.session.execute(text('PRAGMA cache_size = 16'))
+                notification = Notification(type='lớn', content='large send', category='Nhóm', user_id=users['alice'])
+                db.session.add(notification)
+                db.session.flush()
+                fan_out_notification(notification.id, users['alice'], group_ids=[1])
+                written.set()
+                release.wait(30)  # Giữ transaction ghi trong lúc bob đọc hộp thư
+                db.session.commit()
+                db.session.execute(text(f"PRAGMA cache_size = {app.config['SQLITE_PRAGMAS']['cache_size']}"))
+        except Exception as exc:
+            errors.append(exc)
+            written.set()
+
+    bob = login('bob')
+    sender = threading.Thread(target=large_send)
+    sender.start()
+    try:
+        assert written.wait(30)
+        for _ in range(5):
+            started = time.perf_counter()
+            response = bob.get('/')
+            assert response.status_code == 200
+            assert time.perf_counter() - started < 1  # Không chờ busy_timeout
+            assert 'large send' not in response.get_data(as_text=True)
+    finally:
+        release.set()
+        sender.join(30)
+
+    assert not errors, errors
+    assert 'large send' in bob.get('/').get_data(as_text=True)